@@ -0,0 +1,153 @@
+# this file analyses many positions at once, spread over several processes
+# a position is either a fen string or a list of moves in coordinate notation (eg ["e2e4","e7e5"]) from the start
+# every worker process builds its engine, searcher and transposition table once and reuses them for all its tasks
+# run it as a script on a file with one position per line :
+#   python chess_batch.py positions.txt --task search --depth 4 --workers 4
+#   python chess_batch.py positions.txt --task perft --depth 3 --unordered
+
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import os
+import sys
+import time
+
+import chessengine
+import chess_perft
+import chess_search
+from chess_transposition import transposition_table
+
+worker_state = {} # per process : engine, searcher and task settings, filled in by init_worker
+
+def init_worker(task, backend, depth, time_limit, node_limit, tt_size_mb):
+    # runs once in every worker process, so the engine (and its move_functions table), the precomputed
+    # tables of the backend and the transposition table are built once per worker, not once per task
+    gs = chessengine.chess_engine(backend)
+    worker_state["gs"] = gs
+    worker_state["task"] = task
+    worker_state["depth"] = depth
+    worker_state["time_limit"] = time_limit
+    worker_state["node_limit"] = node_limit
+    if task == "search":
+        worker_state["searcher"] = chess_search.searcher(gs, transposition_table(tt_size_mb))
+    pass
+
+def set_up_position(gs, position): # puts a fen string or a list of coordinate moves from the start on gs
+
+    if isinstance(position, str):
+        gs.load_fen(position)
+        return
+    gs.load_fen(chessengine.start_fen)
+    for notation in position:
+        for move in gs.get_valid_moves():
+            if move.get_chess_notation() == notation:
+                gs.make_move(move)
+                break
+        else:
+            raise ValueError("illegal move " + notation + " in " + " ".join(position))
+    pass
+
+def analyse_chunk(chunk): # runs the worker's task on a list of (index, position), returns a list of result dicts
+
+    gs = worker_state["gs"]
+    results = []
+    for index, position in chunk:
+        result = {"index":index, "position":position}
+        try:
+            set_up_position(gs, position)
+            start = time.perf_counter()
+            if worker_state["task"] == "perft":
+                result["nodes"] = chess_perft.perft(gs, worker_state["depth"])
+                result["depth"] = worker_state["depth"]
+            else:
+                s = worker_state["searcher"]
+                s.tt.clear() # nothing is carried over from the last task, so results don't depend on which worker ran it
+                s.orderer.clear()
+                move = s.search(worker_state["depth"], worker_state["time_limit"], worker_state["node_limit"])
+                result["best_move"] = None if move is None else move.get_chess_notation()
+                result["score"] = s.best_score
+                result["depth"] = s.depth_reached
+                result["nodes"] = s.nodes
+            elapsed = time.perf_counter() - start
+            result["nps"] = int(result["nodes"] / elapsed) if elapsed > 0 else 0
+        except Exception as e: # a bad position fails its own result, not the whole batch
+            result["error"] = str(e) if isinstance(e, ValueError) else repr(e) # other errors keep their type name
+        results.append(result)
+    return results
+
+def make_chunks(positions, chunk_size): # groups the (lazily read) positions into lists of (index, position)
+    chunk = []
+    for index, position in enumerate(positions):
+        chunk.append((index, position))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def analyse_positions(positions, task = "search", depth = 4, time_limit = None, node_limit = None, workers = None,
+                      chunk_size = 16, ordered = True, backend = "board", tt_size_mb = 16):
+    # yields one result dict per position : with ordered set in input order, otherwise as soon as each chunk finishes
+    # task is "search" (best_move, score, depth, nodes, nps) or "perft" (nodes, depth, nps), a failed position has "error"
+    # positions can be any iterable, only a few chunks per worker are read ahead of the results
+
+    if task not in ("search","perft"):
+        raise ValueError("unknown task : " + str(task))
+    workers = workers or os.cpu_count() or 1
+    max_pending = workers * 2
+
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker,
+                             initargs = (task, backend, depth, time_limit, node_limit, tt_size_mb)) as executor:
+        pending = deque()
+        for chunk in make_chunks(positions, chunk_size):
+            pending.append(executor.submit(analyse_chunk, chunk))
+            while len(pending) >= max_pending:
+                yield from collect(pending, ordered)
+        while pending:
+            yield from collect(pending, ordered)
+
+def collect(pending, ordered): # waits for the next finished chunk (the oldest one if ordered) and returns its results
+    if ordered:
+        return pending.popleft().result()
+    done, not_done = wait(pending, return_when = FIRST_COMPLETED)
+    future = done.pop()
+    pending.remove(future)
+    return future.result()
+
+def read_positions(path): # one position per line : a fen, or coordinate moves separated by spaces ("startpos" or blank for none)
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("#"):
+                continue
+            if "/" in line:
+                yield line
+            else:
+                yield [notation for notation in line.split() if notation != "startpos"]
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "analyse many positions over several processes")
+    parser.add_argument("file", help = "file with one position per line (fen or coordinate moves)")
+    parser.add_argument("--task", default = "search", choices = ("search","perft"))
+    parser.add_argument("--depth", type = int, default = 4)
+    parser.add_argument("--time", type = float, default = None, help = "seconds per position (search only)")
+    parser.add_argument("--nodes", type = int, default = None, help = "node budget per position (search only)")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default : one per core)")
+    parser.add_argument("--chunk-size", type = int, default = 16)
+    parser.add_argument("--unordered", action = "store_true", help = "print results as they finish")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    count = nodes = 0
+    for result in analyse_positions(read_positions(args.file), args.task, args.depth, args.time, args.nodes, args.workers,
+                                    args.chunk_size, not args.unordered, args.backend):
+        count += 1
+        nodes += result.get("nodes", 0)
+        print(result)
+    elapsed = time.perf_counter() - start
+    print("%d positions, %d nodes in %.2fs (%d nodes per second)" % (count, nodes, elapsed, nodes/elapsed if elapsed > 0 else 0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,292 @@
+# this file stores the bitboard backend of the chess engine
+# every piece type of each colour is kept as one 64 bit integer with a bit set for each square it stands on,
+# plus an occupancy mask per colour. chess_engine.board is still kept up to date so the gui and Move work unchanged
+# squares are numbered row*8 + col, so bit 0 is a8 and bit 63 is h1 (the same orientation as chess_engine.board)
+# select it with chessengine.chess_engine(backend = "bitboard")
+
+from array import array
+
+import chessengine
+
+full_board = (1 << 64) - 1
+pieces = ["wP","wR","wN","wB","wQ","wK","bP","bR","bN","bB","bQ","bK"]
+
+def build_leaper_table(offsets): # for every square, a mask of the squares one jump away in each of the offsets
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq,8)
+        attacks = 0
+        for dir_row, dir_col in offsets:
+            r = row + dir_row
+            c = col + dir_col
+            if 0 <= r <= 7 and 0 <= c <= 7:
+                attacks |= 1 << (r*8 + c)
+        table.append(attacks)
+    return table
+
+def build_ray_table(dir_row, dir_col): # for every square, a mask of the squares up to the edge in one direction
+    table = []
+    for sq in range(64):
+        row, col = divmod(sq,8)
+        ray = 0
+        r = row + dir_row
+        c = col + dir_col
+        while 0 <= r <= 7 and 0 <= c <= 7:
+            ray |= 1 << (r*8 + c)
+            r += dir_row
+            c += dir_col
+        table.append(ray)
+    return table
+
+# precomputed attack tables, built once at import
+knight_attacks = build_leaper_table(chessengine.chess_engine.knight_directions)
+king_attacks = build_leaper_table(chessengine.chess_engine.directions)
+pawn_attacks = {"w":build_leaper_table(((-1,-1),(-1,1))), "b":build_leaper_table(((1,-1),(1,1)))} # squares a pawn on sq attacks
+
+# rays in the same direction order as chess_engine.directions (0-3 orthogonal, 4-7 diagonal)
+rays = [build_ray_table(dir_row,dir_col) for dir_row, dir_col in chessengine.chess_engine.directions]
+ray_is_increasing = [dir_row*8 + dir_col > 0 for dir_row, dir_col in chessengine.chess_engine.directions] # nearest blocker is the lowest bit
+rook_directions = chessengine.rook_directions
+bishop_directions = chessengine.bishop_directions
+
+# between[a][b] : squares strictly between a and b if they share a line, otherwise 0
+between = [[0]*64 for sq in range(64)]
+for d in range(8):
+    for sq in range(64):
+        walked = 0
+        ray = rays[d][sq]
+        while ray:
+            bit = ray & -ray if ray_is_increasing[d] else 1 << (ray.bit_length()-1)
+            between[sq][bit.bit_length()-1] = walked
+            walked |= bit
+            ray ^= bit
+
+def sliding_attacks(sq, occupied, directions): # squares a slider on sq attacks, stopping at the first blocker in each direction
+    attacks = 0
+    for d in directions:
+        ray = rays[d][sq]
+        blockers = ray & occupied
+        if blockers:
+            if ray_is_increasing[d]:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= rays[d][first] # cutting off everything behind the blocker
+        attacks |= ray
+    return attacks
+
+def squares(bitboard): # yields the index of every set bit
+    while bitboard:
+        bit = bitboard & -bitboard
+        yield bit.bit_length() - 1
+        bitboard ^= bit
+
+class bitboard_engine(chessengine.chess_engine):
+
+    def __init__(self, backend = "bitboard", fen = None):
+        super().__init__(backend, fen)
+        self.load_bitboards()
+
+    def load_fen(self, fen):
+        super().load_fen(fen)
+        self.load_bitboards()
+        pass
+
+    def load_bitboards(self): # rebuilds every bitboard from self.board
+
+        self.bitboards = {piece:0 for piece in pieces}
+        self.occupancy = {"w":0, "b":0}
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece != "__":
+                    self.bitboards[piece] |= 1 << (row*8 + col)
+                    self.occupancy[piece[0]] |= 1 << (row*8 + col)
+        pass
+
+    def toggle_piece(self, piece, row, col): # adds a piece to a square or removes it, xor makes this its own inverse
+        bit = 1 << (row*8 + col)
+        self.bitboards[piece] ^= bit
+        self.occupancy[piece[0]] ^= bit
+        pass
+
+    def toggle_move(self, move): # applies a move to the bitboards, calling it a second time takes it back
+
+        placed = move.piece_moved[0] + move.promotion_piece if move.is_pawn_promotion else move.piece_moved
+        self.toggle_piece(move.piece_moved, move.start_row, move.start_col)
+        self.toggle_piece(placed, move.end_row, move.end_col)
+
+        if move.is_enpassant_move:
+            self.toggle_piece(move.piece_captured, move.start_row, move.end_col)
+        elif move.piece_captured != "__":
+            self.toggle_piece(move.piece_captured, move.end_row, move.end_col)
+
+        if move.is_castling_move:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2: # king side, rook jumps from the corner to the left of the king
+                self.toggle_piece(rook, move.end_row, move.end_col+1)
+                self.toggle_piece(rook, move.end_row, move.end_col-1)
+            else:                                  # queen side, rook jumps from the corner to the right of the king
+                self.toggle_piece(rook, move.end_row, move.end_col-2)
+                self.toggle_piece(rook, move.end_row, move.end_col+1)
+        pass
+
+    def make_move(self, move):
+        super().make_move(move)
+        self.toggle_move(move)
+        pass
+
+    def undo_move(self):
+        if len(self.move_log) != 0:
+            last_move = self.move_log[-1]
+            super().undo_move()
+            self.toggle_move(last_move)
+        pass
+
+    def attackers_to(self, sq, color, occupied): # mask of the pieces of color attacking sq, given the occupied squares
+
+        bb = self.bitboards
+        queens = bb[color+"Q"]
+        return (knight_attacks[sq] & bb[color+"N"]) | (king_attacks[sq] & bb[color+"K"]) | \
+               (pawn_attacks["b" if color == "w" else "w"][sq] & bb[color+"P"]) | \
+               (sliding_attacks(sq, occupied, rook_directions) & (bb[color+"R"] | queens)) | \
+               (sliding_attacks(sq, occupied, bishop_directions) & (bb[color+"B"] | queens))
+
+    def square_under_attack(self, row, col, attackers = None): # evaluates if the current square is under attack by the opponent
+
+        enemy_color = "b" if self.white_to_move else "w"
+        attacking = self.attackers_to(row*8 + col, enemy_color, self.occupancy["w"] | self.occupancy["b"])
+        if attackers is not None:
+            attackers.extend(divmod(sq,8) for sq in squares(attacking))
+        return attacking != 0
+
+    def get_possible_move_codes(self, moves = None): # all possible moves regardless of if they end up in a check, packed into ints
+        if moves is None:
+            moves = array('H')
+        return self.generate_moves(moves, legal = False)
+
+    def get_valid_move_codes(self, moves = None): # moves that can be actually made without walking into a check, packed into ints
+        if moves is None:
+            moves = array('H')
+        else:
+            del moves[:]
+        self.generate_moves(moves, legal = True)
+
+        if len(moves) == 0:
+            if self.in_check(): # no more possible moves and player in check
+                self.checkmate = True
+            else:               # no more possible moves and player not in check
+                self.stalemate = True
+        else:
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+
+    def iter_valid_move_codes(self): # all legal moves are generated in one go here (generate_moves is cheap), then handed out one at a time
+        yield from self.generate_moves(array('H'), legal = True)
+
+    def get_possible_capture_codes(self, moves = None): # captures and promotions only, regardless of checks
+        if moves is None:
+            moves = array('H')
+        return self.generate_moves(moves, legal = False, captures_only = True)
+
+    def get_valid_capture_codes(self, moves = None): # legal captures and promotions only, leaves checkmate/stalemate alone
+        if moves is None:
+            moves = array('H')
+        else:
+            del moves[:]
+        return self.generate_moves(moves, legal = True, captures_only = True)
+
+    def generate_moves(self, moves, legal, captures_only = False):
+        # appends pseudo-legal moves, or with legal set, only the ones that don't leave the king in check
+        # with captures_only set, only captures and promotions are generated (quiet moves are masked out, not filtered)
+
+        bb = self.bitboards
+        us, them = ("w","b") if self.white_to_move else ("b","w")
+        own = self.occupancy[us]
+        enemy = self.occupancy[them]
+        occupied = own | enemy
+
+        king_bit = bb[us+"K"]
+        king_sq = king_bit.bit_length() - 1
+        target_mask = full_board & ~own # squares a non king move may end on
+        landing_mask = enemy if captures_only else full_board # squares a piece move may end on, before checks and pins
+        pinned = {}                     # pinned square -> squares that piece may still move to
+        checkers = 0
+
+        if legal:
+            checkers = self.attackers_to(king_sq, them, occupied)
+            if checkers & (checkers-1): # double check, only the king can move
+                target_mask = 0
+            elif checkers:              # single check, capture or block the checker
+                target_mask &= between[king_sq][checkers.bit_length()-1] | checkers
+
+            # an enemy slider that would see the king through exactly one of our pieces pins that piece
+            enemy_queens = bb[them+"Q"]
+            snipers = (sliding_attacks(king_sq, enemy, rook_directions) & (bb[them+"R"] | enemy_queens)) | \
+                      (sliding_attacks(king_sq, enemy, bishop_directions) & (bb[them+"B"] | enemy_queens))
+            for sniper in squares(snipers):
+                blockers = between[king_sq][sniper] & occupied
+                if blockers & own and not blockers & (blockers-1):
+                    pinned[blockers.bit_length()-1] = between[king_sq][sniper] | (1 << sniper)
+
+        # pawns
+        forward = -8 if us == "w" else 8
+        start_row = 6 if us == "w" else 1
+        promotion_row = 1 if us == "w" else 6
+        for sq in squares(bb[us+"P"]):
+            allowed = target_mask & pinned.get(sq, full_board)
+            row = sq >> 3
+            promoting = row == promotion_row
+            to = sq + forward
+            if not occupied & (1 << to) and (promoting or not captures_only):
+                if allowed & (1 << to):
+                    chessengine.add_pawn_move(moves, sq | to << 6, promoting)
+                if row == start_row and not captures_only and not occupied & (1 << (to+forward)) and allowed & (1 << (to+forward)):
+                    moves.append(sq | (to+forward) << 6)
+            for to in squares(pawn_attacks[us][sq] & enemy & allowed):
+                chessengine.add_pawn_move(moves, sq | to << 6, promoting)
+
+        # en passant is tested by lifting both pawns off the board, which also covers pins and checks
+        if self.enpassant_possible != ():
+            ep_sq = self.enpassant_possible[0]*8 + self.enpassant_possible[1]
+            captured_bit = 1 << (ep_sq - forward)
+            for sq in squares(pawn_attacks[them][ep_sq] & bb[us+"P"]):
+                if legal:
+                    after = (occupied ^ (1 << sq) ^ captured_bit) | (1 << ep_sq)
+                    if self.attackers_to(king_sq, them, after) & ~captured_bit:
+                        continue
+                moves.append(sq | ep_sq << 6 | chessengine.enpassant_flag)
+
+        # knights, bishops, rooks and queens
+        for piece in ("N","B","R","Q"):
+            for sq in squares(bb[us+piece]):
+                if piece == "N":
+                    attacks = knight_attacks[sq]
+                elif piece == "B":
+                    attacks = sliding_attacks(sq, occupied, bishop_directions)
+                elif piece == "R":
+                    attacks = sliding_attacks(sq, occupied, rook_directions)
+                else:
+                    attacks = sliding_attacks(sq, occupied, rook_directions) | sliding_attacks(sq, occupied, bishop_directions)
+                for to in squares(attacks & target_mask & landing_mask & pinned.get(sq, full_board)):
+                    moves.append(sq | to << 6)
+
+        # king, tested on each target square with the king lifted off the board
+        for to in squares(king_attacks[king_sq] & ~own & landing_mask):
+            if not legal or not self.attackers_to(to, them, occupied ^ king_bit):
+                moves.append(king_sq | to << 6)
+
+        # castling, the king can't castle out of, through or into check
+        if legal and not checkers and not captures_only:
+            rights = self.castling_rights
+            king_side = rights & (chessengine.white_king_side if us == "w" else chessengine.black_king_side)
+            queen_side = rights & (chessengine.white_queen_side if us == "w" else chessengine.black_queen_side)
+            if king_side and not occupied & (0b110 << king_sq):
+                if not self.attackers_to(king_sq+1, them, occupied) and not self.attackers_to(king_sq+2, them, occupied):
+                    moves.append(king_sq | (king_sq+2) << 6 | chessengine.castling_flag)
+            if queen_side and not occupied & (0b111 << (king_sq-3)): # the b file square only has to be empty
+                if not self.attackers_to(king_sq-1, them, occupied) and not self.attackers_to(king_sq-2, them, occupied):
+                    moves.append(king_sq | (king_sq-2) << 6 | chessengine.castling_flag)
+
+        return moves
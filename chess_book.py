@@ -0,0 +1,140 @@
+# this file reads and builds opening books so the engine doesn't have to search the first moves of a game
+# a book is a polyglot style binary file of 16 byte entries sorted by key :
+#   key (8 bytes, chess_engine.zobrist_key) | move (2 bytes, packed as in chessengine.encode_move) | weight (2 bytes) | unused (4 bytes)
+# all numbers are big endian. the reader memory maps the file and binary searches it, so opening a book
+# costs the same whatever its size and only the pages that are looked at are ever read
+# build a book from pgn files with :
+#   python chess_book.py games.pgn more_games.pgn --out book.bin --plies 20
+# (the pgn files are read with chess_pgn)
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+import chessengine
+import chess_pgn
+
+entry_format = struct.Struct(">QHHI")
+entry_size = entry_format.size
+key_format = struct.Struct(">Q")
+
+class opening_book():
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        if size % entry_size != 0:
+            self.file.close()
+            raise ValueError("not a book file (size is not a multiple of %d) : %s" % (entry_size, path))
+        self.num_entries = size // entry_size
+        # an empty file can't be mapped, it just has no entries
+        self.data = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ) if size else b""
+        pass
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self.file.close()
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        pass
+
+    def __len__(self):
+        return self.num_entries
+
+    def find(self, key): # index of the first entry with this key (or the entry it would go before)
+        low = 0
+        high = self.num_entries
+        data = self.data
+        while low < high:
+            middle = (low + high) // 2
+            if key_format.unpack_from(data, middle * entry_size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get_entries(self, key): # list of (move code, weight) stored for a position key
+        entries = []
+        index = self.find(key)
+        while index < self.num_entries:
+            entry_key, code, weight, unused = entry_format.unpack_from(self.data, index * entry_size)
+            if entry_key != key:
+                break
+            entries.append((code, weight))
+            index += 1
+        return entries
+
+    def get_moves(self, gs): # list of (Move, weight) for the current position, only book moves that are legal here
+        entries = self.get_entries(gs.zobrist_key)
+        if not entries:
+            return []
+        valid = {move.code:move for move in gs.get_valid_moves()} # a book built elsewhere (or a key collision) may hold bad moves
+        return [(valid[code], weight) for code, weight in entries if code in valid]
+
+    def choose_move(self, gs, best = False): # a book Move picked at random by weight (or the heaviest with best set), None if out of book
+        moves = [(move, weight) for move, weight in self.get_moves(gs) if weight > 0]
+        if not moves:
+            return None
+        if best:
+            return max(moves, key = lambda entry: entry[1])[0]
+        return random.choices([move for move, weight in moves], weights = [weight for move, weight in moves])[0]
+
+def open_book(path): # the book at path, or None if there is no such file
+    if not os.path.exists(path):
+        return None
+    return opening_book(path)
+
+game_result_weights = {"1-0":(2,0), "0-1":(0,2), "1/2-1/2":(1,1)} # result -> weight of a (white move, black move)
+
+def build_book(pgn_paths, out_path, max_plies = 20, min_games = 1):
+    # writes a book of the first max_plies moves of every game in pgn_paths, moves played in fewer than min_games games are left out
+    # a move weighs 2 for every game its side won, 1 for every draw (and every game without a result), scaled down to fit 16 bits
+    # returns (games read, entries written)
+
+    weights = {} # (key, code) -> [weight, games]
+    games = 0
+    gs = chessengine.chess_engine()
+    for path in pgn_paths:
+        for headers, sans in chess_pgn.iter_games(path):
+            white_weight, black_weight = game_result_weights.get(headers.get("Result"), (1,1))
+            games += 1
+            try:
+                for move in chess_pgn.replay_game(gs, headers, sans[:max_plies]):
+                    # replay_game yields after making the move, so the entry goes to the position before it
+                    entry = weights.setdefault((gs.zobrist_log[-2], move.code), [0,0])
+                    entry[0] += black_weight if gs.white_to_move else white_weight
+                    entry[1] += 1
+            except ValueError: # the rest of a game with an unreadable move is skipped
+                pass
+
+    entries = sorted((key, code, weight) for (key, code), (weight, count) in weights.items() if count >= min_games)
+    scale = max([weight for key, code, weight in entries] + [0xFFFF]) / 0xFFFF
+    with open(out_path, "wb") as f:
+        for key, code, weight in entries:
+            f.write(entry_format.pack(key, code, int(weight / scale), 0))
+    return games, len(entries)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "build an opening book from pgn files")
+    parser.add_argument("pgn", nargs = "+", help = "pgn files to read")
+    parser.add_argument("--out", default = "book.bin")
+    parser.add_argument("--plies", type = int, default = 20, help = "moves from the start of each game to keep")
+    parser.add_argument("--min-games", type = int, default = 1, help = "leave out moves played in fewer games")
+    args = parser.parse_args(argv)
+
+    games, entries = build_book(args.pgn, args.out, args.plies, args.min_games)
+    print("%d games, %d entries written to %s" % (games, entries, args.out))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# this file scores a position : material plus piece-square tables, tapered between middlegame and endgame
+# chess_engine keeps the running totals (mg_score, eg_score, phase) up to date in make_move/undo_move using
+# the tables below, so evaluate() costs the same at every node. evaluate_from_scratch() rescans the board
+# and must always agree with it
+# scores are in centipawns, the tables are from white's point of view with row 0 being the 8th rank
+
+piece_values_mg = {"P":100, "N":320, "B":330, "R":500, "Q":900, "K":0}
+piece_values_eg = {"P":120, "N":300, "B":320, "R":530, "Q":950, "K":0}
+
+# how much each piece counts towards the game phase, all pieces on the board make max_phase (pure middlegame)
+phase_weights = {"P":0, "N":1, "B":1, "R":2, "Q":4, "K":0}
+max_phase = 24
+
+pawn_mg = [  0,  0,  0,  0,  0,  0,  0,  0,
+            50, 50, 50, 50, 50, 50, 50, 50,
+            10, 10, 20, 30, 30, 20, 10, 10,
+             5,  5, 10, 25, 25, 10,  5,  5,
+             0,  0,  0, 20, 20,  0,  0,  0,
+             5, -5,-10,  0,  0,-10, -5,  5,
+             5, 10, 10,-20,-20, 10, 10,  5,
+             0,  0,  0,  0,  0,  0,  0,  0]
+
+pawn_eg = [  0,  0,  0,  0,  0,  0,  0,  0,
+            80, 80, 80, 80, 80, 80, 80, 80,
+            50, 50, 50, 50, 50, 50, 50, 50,
+            30, 30, 30, 30, 30, 30, 30, 30,
+            20, 20, 20, 20, 20, 20, 20, 20,
+            10, 10, 10, 10, 10, 10, 10, 10,
+            10, 10, 10, 10, 10, 10, 10, 10,
+             0,  0,  0,  0,  0,  0,  0,  0]
+
+knight = [-50,-40,-30,-30,-30,-30,-40,-50,
+          -40,-20,  0,  0,  0,  0,-20,-40,
+          -30,  0, 10, 15, 15, 10,  0,-30,
+          -30,  5, 15, 20, 20, 15,  5,-30,
+          -30,  0, 15, 20, 20, 15,  0,-30,
+          -30,  5, 10, 15, 15, 10,  5,-30,
+          -40,-20,  0,  5,  5,  0,-20,-40,
+          -50,-40,-30,-30,-30,-30,-40,-50]
+
+bishop = [-20,-10,-10,-10,-10,-10,-10,-20,
+          -10,  0,  0,  0,  0,  0,  0,-10,
+          -10,  0,  5, 10, 10,  5,  0,-10,
+          -10,  5,  5, 10, 10,  5,  5,-10,
+          -10,  0, 10, 10, 10, 10,  0,-10,
+          -10, 10, 10, 10, 10, 10, 10,-10,
+          -10,  5,  0,  0,  0,  0,  5,-10,
+          -20,-10,-10,-10,-10,-10,-10,-20]
+
+rook = [  0,  0,  0,  0,  0,  0,  0,  0,
+          5, 10, 10, 10, 10, 10, 10,  5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+         -5,  0,  0,  0,  0,  0,  0, -5,
+          0,  0,  0,  5,  5,  0,  0,  0]
+
+queen = [-20,-10,-10, -5, -5,-10,-10,-20,
+         -10,  0,  0,  0,  0,  0,  0,-10,
+         -10,  0,  5,  5,  5,  5,  0,-10,
+          -5,  0,  5,  5,  5,  5,  0, -5,
+           0,  0,  5,  5,  5,  5,  0, -5,
+         -10,  5,  5,  5,  5,  5,  0,-10,
+         -10,  0,  5,  0,  0,  0,  0,-10,
+         -20,-10,-10, -5, -5,-10,-10,-20]
+
+king_mg = [-30,-40,-40,-50,-50,-40,-40,-30,
+           -30,-40,-40,-50,-50,-40,-40,-30,
+           -30,-40,-40,-50,-50,-40,-40,-30,
+           -30,-40,-40,-50,-50,-40,-40,-30,
+           -20,-30,-30,-40,-40,-30,-30,-20,
+           -10,-20,-20,-20,-20,-20,-20,-10,
+            20, 20,  0,  0,  0,  0, 20, 20,
+            20, 30, 10,  0,  0, 10, 30, 20]
+
+king_eg = [-50,-40,-30,-20,-20,-30,-40,-50,
+           -30,-20,-10,  0,  0,-10,-20,-30,
+           -30,-10, 20, 30, 30, 20,-10,-30,
+           -30,-10, 30, 40, 40, 30,-10,-30,
+           -30,-10, 30, 40, 40, 30,-10,-30,
+           -30,-10, 20, 30, 30, 20,-10,-30,
+           -30,-30,  0,  0,  0,  0,-30,-30,
+           -50,-30,-30,-30,-30,-30,-30,-50]
+
+square_tables_mg = {"P":pawn_mg, "N":knight, "B":bishop, "R":rook, "Q":queen, "K":king_mg}
+square_tables_eg = {"P":pawn_eg, "N":knight, "B":bishop, "R":rook, "Q":queen, "K":king_eg}
+
+def build_score_table(values, tables): # piece -> 64 scores (material + square) from white's point of view, black negated
+    table = {"__":[0]*64}
+    for kind in "PNBRQK":
+        table["w"+kind] = [values[kind] + tables[kind][sq] for sq in range(64)]
+        table["b"+kind] = [-(values[kind] + tables[kind][sq ^ 56]) for sq in range(64)] # sq ^ 56 mirrors the rows
+    return table
+
+# combined tables, read by chess_engine.make_move/undo_move for the running totals
+mg_table = build_score_table(piece_values_mg, square_tables_mg)
+eg_table = build_score_table(piece_values_eg, square_tables_eg)
+phase_table = {piece:(0 if piece == "__" else phase_weights[piece[1]]) for piece in mg_table}
+
+def board_scores(board): # (middlegame score, endgame score, phase) of a board, computed from scratch
+    mg = eg = phase = 0
+    for row in range(8):
+        for col in range(8):
+            piece = board[row][col]
+            if piece != "__":
+                mg += mg_table[piece][row*8 + col]
+                eg += eg_table[piece][row*8 + col]
+                phase += phase_table[piece]
+    return mg, eg, phase
+
+def tapered(mg, eg, phase): # blends the two scores by how much material is left, promotions can push phase past max_phase
+    phase = min(phase, max_phase)
+    return (mg * phase + eg * (max_phase - phase)) // max_phase
+
+def evaluate(gs): # score from the point of view of the side to move, from the engine's running totals
+    score = tapered(gs.mg_score, gs.eg_score, gs.phase)
+    return score if gs.white_to_move else -score
+
+def evaluate_from_scratch(gs): # same as evaluate but rescans the board, for checking the running totals
+    score = tapered(*board_scores(gs.board))
+    return score if gs.white_to_move else -score
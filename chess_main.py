@@ -3,16 +3,16 @@
 # it also displays the current gamestate
 
 import chessengine
+import chess_worker
 import pygame as p
 import time
 
-p.init()
-
 width = height = 800
 dimm = 8
 sq_size = height/dimm
-max_fps = 15
+max_fps = 60 # only squares that changed are drawn, so a frame where nothing happened costs next to nothing
 images = {} # dictionary which maps the piece rep to its image
+surfaces = {} # the pre-rendered board and the highlight overlays, built once by build_surfaces
 
 bgcolor = (78,78,78)
 light = (255,255,255)
@@ -20,6 +20,13 @@ dark = (78,120,55)
 piece_highlight = (255,255,0)
 move_highlight = (0,71,171)
 
+# set a side to True to have the engine play it
+white_is_engine = False
+black_is_engine = False
+engine_time_limit = 2 # seconds the engine may think per move
+book_path = "book.bin" # opening book the engine plays from while it can (see chess_book), ignored if the file doesn't exist
+# press escape while the engine thinks to have it play the best move it has found so far
+
 # function to load images, computationally expensive, called only once
 # eg. to load a white pawn, use images["wP"] 
 def load_images():
@@ -27,6 +34,24 @@ def load_images():
     for piece in pieces:
         images[piece] = p.transform.scale((p.image.load("images/"+ piece +".png")),(0.8*sq_size,0.8*sq_size))
 
+# the board squares are drawn once onto a surface that squares are copied back from, the highlights are
+# made once and reused for every highlighted square
+def build_surfaces():
+    board = p.Surface((width,height))
+    for row in range(8):
+        for col in range(8):
+            if((row+col)%2): # dark squares
+                p.draw.rect(board, dark,(col * sq_size, row * sq_size, sq_size, sq_size))
+            else:        # light squares
+                p.draw.rect(board, light,(col * sq_size, row * sq_size, sq_size, sq_size))
+    surfaces["board"] = board
+    for name, color in (("selected",piece_highlight),("target",move_highlight)):
+        s = p.Surface((sq_size,sq_size))
+        s.set_alpha(100) # transparency value (0:completely transparent, 255:completely opaque)
+        s.fill(color)
+        surfaces[name] = s
+    pass
+
 # main driver (handles i/o, updates board and graphics)
 def main():
     p.init()
@@ -34,32 +59,67 @@ def main():
     clock = p.time.Clock()
     screen.fill(bgcolor)
     gs = chessengine.chess_engine()
-    valid_moves = gs.get_valid_moves() # list storing all allowed moves, costly to call
+    # legal moves and engine searches are worked out on a background thread (see chess_worker), so the window
+    # keeps drawing and reading input meanwhile. a job's result is only used if it is still the latest job of its kind
+    worker = chess_worker.engine_worker(book_path = book_path)
+    valid_moves = [] # list storing all allowed moves, empty until the worker sends them
+    moves_job = worker.request_moves(gs) # set while the legal moves of the position are being worked out
+    search_job = None # set while the engine is thinking about its move
+    engine_failed = False # set when a search fails, the engine waits for the position to change before it tries again
     move_made = False # when this var is true, a move has been made, gamestate changed and need to recalc valid moves
+    font = p.font.SysFont(None, 28)
 
     #print(gs.board)
 
     load_images() # before gameloop
+    build_surfaces()
+    drawn = [None]*64 # what each square showed when it was last drawn (None : draw it again), see draw_gamestate
+    banner_rect = None # where the thinking banner was drawn last frame
 
     running = True
     selected_sq = () # no square is selected at start, keeps track of last click of user (tuple: (row, col))
     player_clicks = [] # keep track of player's 1st and 2nd clicks [(6,4),(4,4)]
+    promotion_choices = [] # when a pawn reaches the last row : its moves for each promotion piece, until the user picks one
+    draw_reason = None # set once the game is drawn by repetition or the fifty move rule
 
     while running:
         
+        human_turn = (gs.white_to_move and not white_is_engine) or (not gs.white_to_move and not black_is_engine)
+
         for e in p.event.get():
             
             if e.type == p.QUIT:
                 running = False
+
+            elif e.type == p.VIDEOEXPOSE: # the window has to be drawn again from scratch
+                drawn = [None]*64
             
             # KEYBOARD COMMANDS
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z:
                     # print("z pressed") # debugging line
+                    if search_job is not None: # the engine was thinking about the position being taken back
+                        worker.cancel(search_job)
+                        search_job = None
                     gs.undo_move()
                     move_made = True                    
-            # MOUSE HANDLER
-            elif e.type == p.MOUSEBUTTONDOWN: 
+                elif e.key == p.K_ESCAPE and search_job is not None: # the search stops and its best move so far is played
+                    worker.cancel(search_job)
+            # MOUSE HANDLER (only once the legal moves of the position are known)
+            elif e.type == p.MOUSEBUTTONDOWN and human_turn and moves_job is None and promotion_choices: # picking the promotion piece
+                location = p.mouse.get_pos()
+                col = int(location[0]//sq_size)
+                row = int(location[1]//sq_size)
+                for move, (choice_row, choice_col) in zip(promotion_choices, promotion_squares(promotion_choices[0])):
+                    if (row,col) == (choice_row,choice_col):
+                        print(move.get_chess_notation())
+                        gs.make_move(move)
+                        move_made = True
+                promotion_choices = [] # a click anywhere else takes the move back
+                selected_sq = ()
+                player_clicks = []
+
+            elif e.type == p.MOUSEBUTTONDOWN and human_turn and moves_job is None: 
                 location = p.mouse.get_pos() # getting the location of the mouse
                 col = int(location[0]//sq_size)
                 row = int(location[1]//sq_size) 
@@ -78,77 +138,147 @@ def main():
                     #print(type(valid_moves))            # debugging line
                     #print(valid_moves)                  # debugging line
                     
-                    for i in range(len(valid_moves)):
-                        if move == valid_moves[i]:
-                            print(move.get_chess_notation())
-                            gs.make_move(valid_moves[i])
-                            move_made = True
-                            selected_sq = ()
-                            player_clicks = []                 
-                    if not move_made:
+                    # the last four digits of a move id are its squares, a promotion has one move per piece on the same squares
+                    matches = [valid_move for valid_move in valid_moves if valid_move.move_id % 10000 == move.move_id % 10000]
+                    if len(matches) > 1: # promotion, the user picks the piece before the move is made
+                        promotion_choices = sorted(matches, key = lambda choice: "QRBN".index(choice.promotion_piece))
+                    elif matches:
+                        print(move.get_chess_notation())
+                        gs.make_move(matches[0])
+                        move_made = True
+                        selected_sq = ()
+                        player_clicks = []                 
+                    if not move_made and not promotion_choices:
                             print("Invalid Move")
                             player_clicks = [selected_sq]  
 
+                    # print(gs.board) # debugging line
+                    # print(gs.move_log[-1].piece_captured) # debugging line
+
+        # RESULTS FROM THE WORKER
+        result = worker.get_result()
+        while result is not None:
+            if result[0] == "moves" and result[1] == moves_job:
+                valid_moves, gs.checkmate, gs.stalemate, draw_reason = result[2:]
+                moves_job = None
                 if gs.checkmate:
                     if gs.white_to_move:
                         print("BLACK WINS")
                     else:
                         print("WHITE WINS")       
-                        
+                elif draw_reason is not None:
+                    print("DRAW BY " + draw_reason.upper())
+            elif result[0] == "error" and result[1] in (moves_job, search_job): # the job is given up, the game goes on without it
+                print("ENGINE ERROR (" + result[2] + ") : " + result[3])
+                if result[1] == moves_job: # the moves are worked out here instead, so the player can still move
+                    moves_job = None
+                    valid_moves = gs.get_valid_moves()
+                    draw_reason = gs.get_draw_reason()
+                else:
+                    search_job = None
+                    engine_failed = True
+            elif result[0] == "search" and result[1] == search_job:
+                move, description = result[2:]
+                search_job = None
+                if move is not None:
+                    print(move.get_chess_notation(), description)
+                    gs.make_move(move)
+                    move_made = True
+            result = worker.get_result()
 
-                    # print(gs.board) # debugging line
-                    # print(gs.move_log[-1].piece_captured) # debugging line
+        # ENGINE MOVES
+        if not human_turn and not move_made and moves_job is None and search_job is None and not engine_failed and \
+           not gs.checkmate and not gs.stalemate and draw_reason is None:
+            search_job = worker.request_search(gs, engine_time_limit)
 
         if move_made:
-            valid_moves = gs.get_valid_moves()
+            # a selection or promotion choice belongs to the position before, its moves can't be made on this one
+            promotion_choices = []
+            selected_sq = ()
+            player_clicks = []
+            engine_failed = False
+            valid_moves = []
+            moves_job = worker.request_moves(gs) # replaces a request still running for the position before
             move_made = False
         
-        draw_gamestate(screen,gs,valid_moves,selected_sq) 
+        if banner_rect is not None: # the banner changes every frame, the squares under it are drawn again before it
+            forget_squares(drawn,banner_rect)
+        dirty_rects = draw_gamestate(screen,gs,valid_moves,selected_sq,promotion_choices,drawn)
+        if search_job is not None:
+            banner_rect = draw_thinking(screen,font,worker.get_progress())
+            dirty_rects.append(banner_rect)
+        else:
+            banner_rect = None
         clock.tick(max_fps)
-        p.display.flip()
+        p.display.update(dirty_rects)
+
+    worker.close()
 
-# highligts all possible moves for a selected piece
-def highlight_squares(screen, gs, valid_moves, selected_sq):
+# what each square shows, (piece, highlight) for all 64 squares, highlight is None, "selected", "target" or "promotion"
+# (a promotion square shows the piece offered instead of the board's)
+def square_contents(gs, valid_moves, selected_sq, promotion_choices):
 
+    contents = [(gs.board[sq >> 3][sq & 7], None) for sq in range(64)]
     if selected_sq != ():
         row,col = selected_sq # making sure that the selected square is same color as player supposed to move
         if (gs.board[row][col][0] == "w" and gs.white_to_move) or (gs.board[row][col][0] == "b" and not gs.white_to_move):
-            # highlighting the selected square
-            s = p.Surface((sq_size,sq_size))
-            s.set_alpha(100) # transparency value (0:completely transparent, 255:completely opaque)
-            s.fill(piece_highlight)
-            screen.blit(s, (col*sq_size,row*sq_size))
-            for move in valid_moves:
+            contents[row*8 + col] = (gs.board[row][col], "selected")
+            for move in valid_moves: # highligts all possible moves for the selected piece
                 if move.start_row == row and move.start_col == col:
-                    sq = p.Surface((sq_size,sq_size))
-                    sq.set_alpha(100)
-                    sq.fill(move_highlight)
-                    screen.blit(sq, (move.end_col*sq_size,move.end_row*sq_size))
+                    end_sq = move.end_row*8 + move.end_col
+                    contents[end_sq] = (contents[end_sq][0], "target")
+    if promotion_choices:
+        for move, (row, col) in zip(promotion_choices, promotion_squares(promotion_choices[0])):
+            contents[row*8 + col] = (move.piece_moved[0] + move.promotion_piece, "promotion")
+    return contents
 
-    pass
+# squares the promotion pieces are offered on : the promotion square and the three next to it towards the middle of the board
+def promotion_squares(move):
+    step = 1 if move.end_row == 0 else -1
+    return [(move.end_row + step*i, move.end_col) for i in range(4)]
+
+# shows that the engine is thinking, with the depth it has finished and its speed so far, returns the rect it covers
+def draw_thinking(screen, font, progress):
+    text = "thinking..."
+    if progress is not None:
+        depth, nodes, nps = progress
+        text += "  depth %d  %d nodes  %d nps" % (depth, nodes, nps)
+    label = font.render(text, True, light)
+    rect = p.Rect(0, 0, label.get_width() + 20, label.get_height() + 10)
+    p.draw.rect(screen, bgcolor, rect)
+    screen.blit(label, (10, 5))
+    return rect
 
 # responsible for all graphics in a game
-def draw_gamestate(screen,gs,valid_moves,selected_sq):
-    draw_board(screen)           # draws the squares on the board
-    highlight_squares(screen,gs,valid_moves,selected_sq)
-    draw_pieces(screen,gs.board) # draws the pieces on the board
-    pass
+# drawn holds what every square showed when it was last drawn, only the squares that changed since are drawn again
+# returns the rects of the screen that changed, for p.display.update
+def draw_gamestate(screen,gs,valid_moves,selected_sq,promotion_choices,drawn):
+    rects = []
+    for sq, content in enumerate(square_contents(gs,valid_moves,selected_sq,promotion_choices)):
+        if drawn[sq] != content:
+            rects.append(draw_square(screen,sq >> 3,sq & 7,content))
+            drawn[sq] = content
+    return rects
 
-def draw_board(screen):
-    for row in range(8):
-        for col in range(8):
-            if((row+col)%2): # dark squares
-                p.draw.rect(screen, dark,(col * sq_size, row * sq_size, sq_size, sq_size))
-            else:        # light squares
-                p.draw.rect(screen, light,(col * sq_size, row * sq_size, sq_size, sq_size))
-    pass
+def draw_square(screen,row,col,content): # draws one square from the cached surfaces, returns its rect
+    rect = p.Rect(col * sq_size, row * sq_size, sq_size, sq_size)
+    piece, highlight = content
+    if highlight == "promotion":
+        p.draw.rect(screen, bgcolor, rect)
+    else:
+        screen.blit(surfaces["board"], rect, rect) # the square of the pre-rendered board
+        if highlight is not None:
+            screen.blit(surfaces[highlight], rect)
+    if piece != "__":
+        screen.blit(images[piece],((col * sq_size)+10, (row * sq_size)+10, sq_size, sq_size))
+    return rect
 
-def draw_pieces(screen,board):
-    for row in range(8):
-        for col in range(8):
-            if(board[row][col]!="__"):
-                screen.blit(images[board[row][col]],((col * sq_size)+10, (row * sq_size)+10, sq_size, sq_size))
+def forget_squares(drawn,rect): # makes the squares under rect be drawn again, once something drawn over them goes away
+    for sq in range(64):
+        if rect.colliderect((sq & 7) * sq_size, (sq >> 3) * sq_size, sq_size, sq_size):
+            drawn[sq] = None
     pass
 
 
-main()
\ No newline at end of file
+if __name__ == "__main__": # importing this file (eg for its drawing functions) doesn't open a window
+    main()
@@ -0,0 +1,90 @@
+# this file orders moves for the search, the earlier the best move is searched the more of the tree alpha-beta cuts off
+# moves come out in stages : the hash move, captures (most valuable victim, least valuable attacker first),
+# the killer moves of the ply, then the other quiet moves by their history score
+# every stage is only sorted when the search gets to it, so after a cutoff the rest is never scored
+
+from array import array
+
+import chessengine
+
+# piece ranks for mvv-lva : a capture scores victim * 8 - attacker
+piece_ranks = {"P":1, "N":2, "B":3, "R":4, "Q":5, "K":6}
+
+class move_orderer():
+
+    def __init__(self, max_ply = 128):
+        self.max_ply = max_ply
+        self.killers = [[0,0] for ply in range(max_ply)] # two quiet moves per ply that caused a cutoff, most recent first
+        self.history = array('q', [0]) * 4096            # cutoff score per (start square, end square), kept across searches
+        pass
+
+    def new_search(self): # killers are only good for the position they were found in, history is aged instead of dropped
+        for killers in self.killers:
+            killers[0] = killers[1] = 0
+        history = self.history
+        for i in range(4096):
+            history[i] >>= 1
+        pass
+
+    def clear(self):
+        self.killers = [[0,0] for ply in range(self.max_ply)]
+        self.history = array('q', [0]) * 4096
+        pass
+
+    def is_quiet(self, board, code): # neither a capture nor a promotion
+        end_sq = code >> 6 & 63
+        return board[end_sq >> 3][end_sq & 7] == "__" and code & chessengine.move_flag_mask in (0, chessengine.castling_flag)
+
+    def capture_score(self, board, code):
+        start_sq = code & 63
+        end_sq = code >> 6 & 63
+        flag = code & chessengine.move_flag_mask
+        victim = board[end_sq >> 3][end_sq & 7]
+        if flag == chessengine.enpassant_flag:
+            score = piece_ranks["P"] * 8
+        elif victim != "__":
+            score = piece_ranks[victim[1]] * 8
+        else:
+            score = 0
+        if flag == chessengine.promotion_flag: # promoting counts like winning the new piece, so underpromotions come last
+            score += piece_ranks[chessengine.promotion_pieces[code >> 14]] * 8
+        return score - piece_ranks[board[start_sq >> 3][start_sq & 7][1]]
+
+    def ordered_moves(self, board, moves, hash_move, ply): # yields the move codes of moves in search order
+
+        if hash_move != 0 and hash_move in moves:
+            yield hash_move
+
+        captures = []
+        quiets = []
+        for code in moves:
+            if code == hash_move:
+                continue
+            if self.is_quiet(board, code):
+                quiets.append(code)
+            else:
+                captures.append(code)
+
+        if captures:
+            captures.sort(key = lambda code: self.capture_score(board, code), reverse = True)
+            yield from captures
+
+        for killer in self.killers[ply]:
+            if killer != 0 and killer != hash_move and killer in quiets:
+                quiets.remove(killer)
+                yield killer
+
+        if quiets:
+            history = self.history
+            quiets.sort(key = lambda code: history[code & 4095], reverse = True)
+            yield from quiets
+
+    def record_cutoff(self, board, code, depth, ply): # called with the move that failed high, before it is made or after it is undone
+        if not self.is_quiet(board, code): # captures are already ordered well by mvv-lva
+            return
+        killers = self.killers[ply]
+        if killers[0] != code:
+            killers[1] = killers[0]
+            killers[0] = code
+        self.history[code & 4095] += depth * depth
+        pass
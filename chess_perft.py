@@ -0,0 +1,108 @@
+# this file counts the leaf nodes of the legal move tree (perft) to check and time move generation
+# run it as a script to check the engine against the bundled reference positions :
+#   python chess_perft.py                       all bundled positions up to depth 3
+#   python chess_perft.py --depth 5             all bundled positions up to depth 5 (where a count is known)
+#   python chess_perft.py --fen "<fen>" --depth 4 --divide
+# it exits with status 1 if any count differs from its reference count
+
+import argparse
+from array import array
+import sys
+import time
+
+import chessengine
+
+start_fen = chessengine.start_fen
+
+# (name, fen, reference node counts for depth 1, 2, 3, ...)
+standard_positions = [
+    ("startpos", start_fen,
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862]),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333, 15833292]),
+    ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487, 89941194]),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+]
+
+def perft(gs, depth, buffers = None): # number of leaf nodes depth plies below the current position
+
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [array('H') for d in range(depth+1)] # one move list per depth, reused all the way down
+
+    moves = gs.get_valid_move_codes(buffers[depth])
+    if depth == 1: # the leaves don't have to be made, counting them is enough
+        return len(moves)
+
+    nodes = 0
+    board = gs.board
+    for code in moves:
+        gs.make_move(chessengine.Move.from_code(code, board))
+        nodes += perft(gs, depth-1, buffers)
+        gs.undo_move()
+    return nodes
+
+def divide(gs, depth): # perft split by root move, returns a list of (coordinate notation, nodes)
+
+    results = []
+    buffers = [array('H') for d in range(depth+1)]
+    for move in gs.get_valid_moves():
+        gs.make_move(move)
+        results.append((move.get_chess_notation(), perft(gs, depth-1, buffers)))
+        gs.undo_move()
+    return results
+
+def run_position(name, fen, expected, max_depth, backend = "board", show_divide = False):
+    # runs perft on fen for depths 1..max_depth, printing counts and nodes per second
+    # expected is the list of reference counts (may be shorter than max_depth), returns False on any mismatch
+
+    gs = chessengine.chess_engine.from_fen(fen, backend)
+    passed = True
+    for depth in range(1, max_depth+1):
+        start = time.perf_counter()
+        if show_divide:
+            split = divide(gs, depth)
+            nodes = sum(count for notation, count in split)
+        else:
+            nodes = perft(gs, depth)
+        elapsed = time.perf_counter() - start
+
+        status = ""
+        if depth <= len(expected):
+            if nodes == expected[depth-1]:
+                status = "ok"
+            else:
+                status = "MISMATCH, expected " + str(expected[depth-1])
+                passed = False
+        print("%-12s depth %d : %10d nodes  %8.2fs  %8d nps  %s" % (name, depth, nodes, elapsed, nodes/elapsed if elapsed > 0 else 0, status))
+        if show_divide:
+            for notation, count in sorted(split):
+                print("    " + notation + " : " + str(count))
+    return passed
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "perft node counts for the chess engine")
+    parser.add_argument("--fen", help = "position to count from (default : the bundled reference positions)")
+    parser.add_argument("--depth", type = int, default = 3, help = "deepest depth to count")
+    parser.add_argument("--divide", action = "store_true", help = "print the node count below every root move")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    passed = True
+    if args.fen:
+        passed = run_position("fen", args.fen, [], args.depth, args.backend, args.divide)
+    else:
+        for name, fen, expected in standard_positions:
+            passed = run_position(name, fen, expected, min(args.depth, len(expected)), args.backend, args.divide) and passed
+
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
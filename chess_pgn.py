@@ -0,0 +1,252 @@
+# this file reads and writes chess notation : standard algebraic notation (san) moves and pgn game files
+# pgn files are read a line at a time and games are replayed with make_move one after the other,
+# so a database of any size can be streamed through without holding more than one game in memory
+# run it as a script to time reading a pgn file :
+#   python chess_pgn.py games.pgn
+
+import argparse
+from array import array
+import re
+import sys
+import time
+
+import chessengine
+from chessengine import Move
+
+result_tokens = ("1-0", "0-1", "1/2-1/2", "*")
+header_pattern = re.compile(r'\[(\w+)\s+"(.*)"\]')
+movetext_noise = re.compile(r"\{[^}]*\}|;[^\n]*|\$\d+|\d+\.(\.\.)?") # comments, annotation glyphs and move numbers
+variation_pattern = re.compile(r"\([^()]*\)")
+san_pattern = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+
+def parse_san(gs, san, moves = None): # the legal Move a san string stands for in gs, raises ValueError if there isn't exactly one
+    # moves can be a preallocated array('H') for the legal move codes, so replaying games doesn't allocate one per move
+
+    moves = gs.get_valid_move_codes(moves)
+    board = gs.board
+    text = san.rstrip("+#!?")
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        end_col = 6 if len(text) == 3 else 2
+        for code in moves:
+            if code & chessengine.move_flag_mask == chessengine.castling_flag and (code >> 6) & 7 == end_col:
+                return Move.from_code(code, board)
+        raise ValueError("castling is not legal here : " + san)
+
+    match = san_pattern.match(text)
+    if match is None:
+        raise ValueError("not a san move : " + san)
+    piece, from_file, from_rank, to, promotion = match.groups()
+    piece = piece or "P"
+    end_sq = Move.ranks_to_rows[to[1]]*8 + Move.files_to_cols[to[0]]
+    start_col = Move.files_to_cols[from_file] if from_file else -1
+    start_row = Move.ranks_to_rows[from_rank] if from_rank else -1
+
+    found = None
+    for code in moves:
+        if (code >> 6) & 63 != end_sq:
+            continue
+        start_sq = code & 63
+        flag = code & chessengine.move_flag_mask
+        if board[start_sq >> 3][start_sq & 7][1] != piece or flag == chessengine.castling_flag:
+            continue
+        if (start_col != -1 and start_sq & 7 != start_col) or (start_row != -1 and start_sq >> 3 != start_row):
+            continue
+        if flag == chessengine.promotion_flag and chessengine.promotion_pieces[code >> 14] != (promotion or "Q"):
+            continue
+        if found is not None:
+            raise ValueError("ambiguous san move : " + san)
+        found = code
+    if found is None:
+        raise ValueError("no legal move matches " + san)
+    return Move.from_code(found, board)
+
+def move_to_san(gs, move, moves = None): # the san string of a legal move in gs, moves can be the legal move codes if already known
+
+    if move.is_castling_move:
+        san = "O-O" if move.end_col == 6 else "O-O-O"
+    else:
+        piece = move.piece_moved[1]
+        to = move.get_rank_file(move.end_row, move.end_col)
+        capture = "x" if move.piece_captured != "__" else ""
+        if piece == "P":
+            san = (Move.cols_to_files[move.start_col] + capture if capture else "") + to
+            if move.is_pawn_promotion:
+                san += "=" + move.promotion_piece
+        else:
+            # other pieces of the same kind that can reach the same square decide what has to be spelled out
+            if moves is None:
+                moves = gs.get_valid_move_codes()
+            board = gs.board
+            end_sq = move.end_row*8 + move.end_col
+            same_file = same_rank = rivals = False
+            for code in moves:
+                start_sq = code & 63
+                if (code >> 6) & 63 != end_sq or board[start_sq >> 3][start_sq & 7] != move.piece_moved or start_sq == move.start_row*8 + move.start_col:
+                    continue
+                rivals = True
+                same_file = same_file or start_sq & 7 == move.start_col
+                same_rank = same_rank or start_sq >> 3 == move.start_row
+            disambiguation = ""
+            if rivals:
+                if not same_file:
+                    disambiguation = Move.cols_to_files[move.start_col]
+                elif not same_rank:
+                    disambiguation = Move.rows_to_ranks[move.start_row]
+                else:
+                    disambiguation = move.get_rank_file(move.start_row, move.start_col)
+            san = piece + disambiguation + capture + to
+
+    # check and mate suffixes, found by playing the move (the flags are left as they were for the position in gs)
+    checkmate, stalemate = gs.checkmate, gs.stalemate
+    gs.make_move(move)
+    if gs.in_check():
+        san += "+" if gs.has_any_legal_move() else "#"
+    gs.undo_move()
+    gs.checkmate, gs.stalemate = checkmate, stalemate
+    return san
+
+def iter_games(source): # yields (headers dict, list of san strings) for each game in a pgn file (a path or an open text file)
+    # movetext lines are joined with newlines, a ; comment only runs to the end of its own line
+    if isinstance(source, str):
+        with open(source, errors = "replace") as f:
+            yield from iter_games(f)
+        return
+
+    headers = {}
+    movetext = []
+    in_comment = False # inside a { } comment that goes on over several lines
+    for line in source:
+        line = line.strip()
+        if line.startswith("[") and not in_comment:
+            match = header_pattern.match(line)
+            if match:
+                if movetext: # a game without a result token ends at the next header
+                    yield headers, parse_movetext("\n".join(movetext))
+                    headers, movetext = {}, []
+                headers[match.group(1)] = match.group(2)
+                continue
+        if line and not (line.startswith("%") and not in_comment):
+            movetext.append(line)
+            # a result token only ends the game if it is outside any comment
+            text, in_comment = strip_comments(line, in_comment)
+            tokens = text.split()
+            if tokens and tokens[-1] in result_tokens:
+                yield headers, parse_movetext("\n".join(movetext))
+                headers, movetext = {}, []
+    if movetext or headers:
+        yield headers, parse_movetext("\n".join(movetext))
+
+def strip_comments(line, in_comment): # (line without its comments, whether a { comment is still open at its end)
+    text = []
+    i = 0
+    while i < len(line):
+        if in_comment:
+            end = line.find("}", i)
+            if end == -1:
+                return "".join(text), True
+            in_comment = False
+            i = end + 1
+        elif line[i] == "{":
+            in_comment = True
+            i += 1
+        elif line[i] == ";": # the rest of the line is a comment
+            break
+        else:
+            text.append(line[i])
+            i += 1
+    return "".join(text), in_comment
+
+def parse_movetext(text): # san moves of the main line, with comments, variations and move numbers dropped
+    text = movetext_noise.sub(" ", text)
+    while "(" in text: # variations can nest, innermost first
+        new_text = variation_pattern.sub(" ", text)
+        if new_text == text: # an unbalanced bracket, nothing more can be taken out
+            break
+        text = new_text
+    return [token for token in text.split() if token not in result_tokens]
+
+def replay_game(gs, headers, sans, moves = None):
+    # sets gs to the game's start position and plays the san moves on it with make_move, yielding each Move after it is made
+    # stops with ValueError at the first move that can't be read
+    gs.load_fen(headers.get("FEN", chessengine.start_fen))
+    if moves is None:
+        moves = array('H')
+    for san in sans:
+        move = parse_san(gs, san, moves)
+        gs.make_move(move)
+        yield move
+
+def replay_games(source, gs = None):
+    # streams every game of a pgn file through gs (a new engine if not given) with make_move
+    # yields (headers, list of Moves, error) once each game has been played, gs is left at the game's last position
+    # error is None, or the reason the rest of the game couldn't be read (the moves up to it are still played)
+    if gs is None:
+        gs = chessengine.chess_engine()
+    buffer = array('H')
+    for headers, sans in iter_games(source):
+        played = []
+        error = None
+        try:
+            for move in replay_game(gs, headers, sans, buffer):
+                played.append(move)
+        except ValueError as e:
+            error = str(e)
+        yield headers, played, error
+
+def game_to_pgn(gs, headers = None, result = "*"): # the game played on gs so far (all of its move_log) as pgn text
+
+    moves = list(gs.move_log)
+    for move in moves: # going back to the start position to write the moves from there
+        gs.undo_move()
+    start_fen = gs.to_fen()
+
+    tags = {"Event":"?", "Site":"?", "Date":"????.??.??", "Round":"?", "White":"?", "Black":"?", "Result":result}
+    tags.update(headers or {})
+    if start_fen != chessengine.start_fen:
+        tags["SetUp"] = "1"
+        tags["FEN"] = start_fen
+
+    tokens = []
+    for move in moves:
+        if gs.white_to_move:
+            tokens.append(str(gs.fullmove_number) + ".")
+        elif not tokens:
+            tokens.append(str(gs.fullmove_number) + "...")
+        tokens.append(move_to_san(gs, move))
+        gs.make_move(move)
+    tokens.append(tags["Result"])
+
+    lines = ['[%s "%s"]' % (name, value) for name, value in tags.items()] + [""]
+    line = ""
+    for token in tokens: # movetext lines are kept under 80 characters
+        if line and len(line) + len(token) >= 80:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "replay every game of a pgn file and report the speed")
+    parser.add_argument("pgn", help = "pgn file to read")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    gs = chessengine.chess_engine(args.backend)
+    games = plies = errors = 0
+    start = time.perf_counter()
+    for headers, moves, error in replay_games(args.pgn, gs):
+        games += 1
+        plies += len(moves)
+        if error is not None:
+            errors += 1
+            print("game %d (%s - %s) : %s" % (games, headers.get("White","?"), headers.get("Black","?"), error))
+    elapsed = time.perf_counter() - start
+    print("%d games, %d plies, %d with errors in %.2fs (%.1f games per second, %d plies per second)" %
+          (games, plies, errors, elapsed, games/elapsed if elapsed > 0 else 0, plies/elapsed if elapsed > 0 else 0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+# this file picks a move for the side to move in a chess_engine position
+# negamax alpha-beta search with iterative deepening, stopped by a depth, time or node budget
+# the search plays moves on the engine with make_move/undo_move and never copies the board
+
+import argparse
+from array import array
+import sys
+import time
+
+import chessengine
+from chess_evaluation import evaluate, piece_values_mg
+from chess_ordering import move_orderer
+from chess_transposition import transposition_table, exact_bound, lower_bound, upper_bound
+
+mate_score = 100000 # mate scores are mate_score - ply, so shorter mates score higher
+max_ply = 128
+delta_margin = 200 # quiescence skips captures that can't lift the score to alpha even with this much to spare
+
+class search_timeout(Exception): # raised inside the search when the deadline or node budget runs out, or it is stopped
+    pass
+
+class searcher():
+
+    def __init__(self, gs, tt = None, ordering = True):
+        # tt is a transposition_table, shared between searches if one is passed in
+        # ordering turns the move orderer (see chess_ordering) on, without it only the hash move is searched first
+        # (quiescence sorts its captures either way)
+        self.gs = gs
+        self.tt = tt if tt is not None else transposition_table()
+        self.ordering = ordering
+        self.orderer = move_orderer(max_ply) # its history table is kept from one search to the next
+        self.move_buffers = [array('H') for ply in range(max_ply)] # one move list per ply, reused every search
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_move = None
+        self.best_code = None
+        self.best_score = 0
+        self.elapsed = 0.0
+        self.stopped = False # set by stop(), possibly from another thread, and only cleared by the caller
+        pass
+
+    def stop(self): # makes a running search (on another thread) return its best move at its next limits check
+        self.stopped = True
+        pass
+
+    @property
+    def nps(self): # nodes searched per second in the last search
+        return int(self.nodes / self.elapsed) if self.elapsed > 0 else 0
+
+    def search(self, max_depth = 64, time_limit = None, node_limit = None, on_depth = None):
+        # searches deeper and deeper until max_depth is done or the time (seconds) or node budget runs out
+        # returns the best Move found by the last finished depth (None if there are no legal moves)
+        # on_depth, if given, is called with this searcher after every finished depth
+
+        gs = self.gs
+        self.nodes = 0
+        self.depth_reached = 0
+        self.best_move = None
+        self.best_code = None
+        self.best_score = 0
+        self.start_time = time.perf_counter()
+        self.deadline = None if time_limit is None else self.start_time + time_limit
+        self.node_limit = node_limit
+
+        self.tt.new_search()
+        self.orderer.new_search()
+
+        root_ply = len(gs.move_log)
+        checkmate, stalemate = gs.checkmate, gs.stalemate # the search leaves these set for whatever node it saw last
+
+        root_moves = list(gs.get_valid_move_codes())
+        if self.ordering:
+            root_moves = list(self.orderer.ordered_moves(gs.board, root_moves, 0, 0))
+        best_code = None
+        try:
+            for depth in range(1, max_depth+1):
+                if best_code is not None: # searching the best move of the last depth first gives the most cutoffs
+                    root_moves.remove(best_code)
+                    root_moves.insert(0, best_code)
+                score, code = self.search_root(root_moves, depth)
+                best_code, self.best_score, self.depth_reached = code, score, depth
+                self.best_code = code
+                self.elapsed = time.perf_counter() - self.start_time
+                if on_depth is not None:
+                    on_depth(self)
+                if code is None or abs(score) >= mate_score - max_ply: # no moves, or a forced mate was found
+                    break
+        except search_timeout:
+            while len(gs.move_log) > root_ply: # unwinding the moves the interrupted search had made
+                gs.undo_move()
+            if best_code is None and root_moves: # ran out before finishing depth 1, any legal move beats none
+                best_code = root_moves[0]
+
+        gs.checkmate, gs.stalemate = checkmate, stalemate
+        self.elapsed = time.perf_counter() - self.start_time
+        self.best_move = None if best_code is None else chessengine.Move.from_code(best_code, gs.board)
+        return self.best_move
+
+    def search_root(self, root_moves, depth): # returns (score, best move code) at the root
+
+        gs = self.gs
+        alpha = -mate_score - 1
+        best_code = None
+        for code in root_moves:
+            gs.make_move(chessengine.Move.from_code(code, gs.board))
+            score = -self.negamax(depth-1, -mate_score-1, -alpha, 1)
+            gs.undo_move()
+            if score > alpha:
+                alpha = score
+                best_code = code
+        return alpha, best_code
+
+    def negamax(self, depth, alpha, beta, ply): # score of the position for the side to move, within (alpha, beta)
+
+        if depth == 0: # the horizon, captures are played out so a hanging piece isn't scored as if it were safe
+            return self.quiescence(alpha, beta, ply)
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0 or self.nodes == self.node_limit: # reading the clock every node would cost too much
+            self.check_limits()
+
+        gs = self.gs
+        # inside the tree a position seen once before is already scored as a draw, if repeating it is
+        # the best either side can do it would end up a threefold repetition anyway
+        # the fifty move rule only draws if the side to move isn't checkmated (as in chess_engine.get_draw_reason)
+        if gs.is_repetition() or (gs.halfmove_clock >= 100 and (not gs.in_check() or gs.has_any_legal_move())):
+            return 0
+
+        # a stored result of a search at least this deep can answer the node outright
+        key = gs.zobrist_key
+        hash_move = 0
+        entry = self.tt.probe(key)
+        if entry is not None:
+            entry_depth, score, bound, hash_move = entry
+            if entry_depth >= depth:
+                score = score_from_tt(score, ply)
+                if bound == exact_bound or (bound == lower_bound and score >= beta) or (bound == upper_bound and score <= alpha):
+                    return score
+
+        moves = gs.get_valid_move_codes(self.move_buffers[ply])
+        if len(moves) == 0:
+            return -mate_score + ply if gs.checkmate else 0 # checkmate or stalemate
+
+        board = gs.board
+        if self.ordering:
+            moves = self.orderer.ordered_moves(board, moves, hash_move, ply)
+        elif hash_move != 0 and hash_move in moves: # the best move found last time is searched first
+            moves.remove(hash_move)
+            moves.insert(0, hash_move)
+
+        original_alpha = alpha
+        best_score = -mate_score - 1
+        best_code = 0
+        for code in moves:
+            gs.make_move(chessengine.Move.from_code(code, board))
+            score = -self.negamax(depth-1, -beta, -alpha, ply+1)
+            gs.undo_move()
+            if score > best_score:
+                best_score = score
+                best_code = code
+            if score >= beta: # the opponent won't allow this line
+                if self.ordering:
+                    self.orderer.record_cutoff(board, code, depth, ply)
+                break
+            if score > alpha:
+                alpha = score
+
+        if best_score >= beta:
+            bound = lower_bound
+        elif best_score > original_alpha:
+            bound = exact_bound
+        else:
+            bound = upper_bound
+        self.tt.store(key, depth, score_to_tt(best_score, ply), bound, best_code)
+        return best_score
+
+    def quiescence(self, alpha, beta, ply): # searches only captures and promotions until the position is quiet
+
+        self.nodes += 1
+        if self.nodes & 1023 == 0 or self.nodes == self.node_limit:
+            self.check_limits()
+
+        gs = self.gs
+        # a side in check with no way out is mated, stopping at its first legal move makes this cheap when it isn't
+        if gs.in_check() and not gs.has_any_legal_move():
+            return -mate_score + ply
+        # stand pat : the side to move doesn't have to capture, so the static score is a lower bound
+        best_score = evaluate(gs)
+        if best_score >= beta or ply >= max_ply - 1:
+            return best_score
+        if best_score > alpha:
+            alpha = best_score
+
+        # captures are always taken in mvv-lva order here, unordered captures blow the quiescence tree up
+        board = gs.board
+        moves = self.orderer.ordered_moves(board, gs.get_valid_capture_codes(self.move_buffers[ply]), 0, ply)
+        for code in moves:
+            # delta pruning : even winning the captured piece for free wouldn't get back to alpha
+            if best_score + capture_gain(board, code) + delta_margin <= alpha:
+                continue
+            gs.make_move(chessengine.Move.from_code(code, board))
+            score = -self.quiescence(-beta, -alpha, ply+1)
+            gs.undo_move()
+            if score > best_score:
+                best_score = score
+            if score >= beta:
+                break
+            if score > alpha:
+                alpha = score
+        return best_score
+
+    def principal_variation(self, max_length = 32):
+        # move codes of the expected line from the root : the best move of the last finished depth, then the
+        # hash moves stored for the positions after it, for as long as they are legal and don't repeat
+        gs = self.gs
+        pv = []
+        code = self.best_code
+        checkmate, stalemate = gs.checkmate, gs.stalemate
+        seen = {gs.zobrist_key}
+        while code is not None and code != 0 and len(pv) < max_length and code in gs.get_valid_move_codes():
+            gs.make_move(chessengine.Move.from_code(code, gs.board))
+            pv.append(code)
+            if gs.zobrist_key in seen:
+                break
+            seen.add(gs.zobrist_key)
+            entry = self.tt.probe(gs.zobrist_key)
+            code = None if entry is None else entry[3]
+        for code in pv:
+            gs.undo_move()
+        gs.checkmate, gs.stalemate = checkmate, stalemate
+        return pv
+
+    def check_limits(self): # stops the search once the deadline or node budget is passed, or stop() was called
+        if self.stopped:
+            raise search_timeout()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise search_timeout()
+        if self.node_limit is not None and self.nodes >= self.node_limit:
+            raise search_timeout()
+        pass
+
+def capture_gain(board, code): # material a capture or promotion wins at most
+    end_sq = code >> 6 & 63
+    flag = code & chessengine.move_flag_mask
+    victim = board[end_sq >> 3][end_sq & 7]
+    if flag == chessengine.enpassant_flag:
+        gain = piece_values_mg["P"]
+    else:
+        gain = piece_values_mg[victim[1]] if victim != "__" else 0
+    if flag == chessengine.promotion_flag:
+        gain += piece_values_mg[chessengine.promotion_pieces[code >> 14]] - piece_values_mg["P"]
+    return gain
+
+def score_to_tt(score, ply): # mate scores are stored as distance from the node, not from the root
+    if score >= mate_score - max_ply:
+        return score + ply
+    if score <= -mate_score + max_ply:
+        return score - ply
+    return score
+
+def score_from_tt(score, ply):
+    if score >= mate_score - max_ply:
+        return score - ply
+    if score <= -mate_score + max_ply:
+        return score + ply
+    return score
+
+def find_best_move(gs, max_depth = 64, time_limit = None, node_limit = None, tt = None): # convenience wrapper, returns (Move, searcher)
+    s = searcher(gs, tt)
+    move = s.search(max_depth, time_limit, node_limit)
+    return move, s
+
+# fixed depth positions for comparing move ordering, the perft reference positions plus a middlegame
+bench_positions = [
+    ("startpos", chessengine.start_fen),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1"),
+    ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"),
+    ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"),
+    ("italian", "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/2NP1N2/PPP2PPP/R1BQK2R b KQkq - 0 5"),
+]
+
+def bench(depth, backend = "board"): # searches every bench position to depth with and without move ordering, prints the nodes
+    totals = {False:0, True:0}
+    for name, fen in bench_positions:
+        line = "%-12s depth %d" % (name, depth)
+        for ordering in (False, True):
+            gs = chessengine.chess_engine.from_fen(fen, backend)
+            s = searcher(gs, ordering = ordering)
+            move = s.search(depth)
+            totals[ordering] += s.nodes
+            line += "  %s %9d nodes %7.2fs %s" % ("ordered" if ordering else "plain  ", s.nodes, s.elapsed, move.get_chess_notation())
+        print(line)
+    print("total : %d nodes plain, %d nodes ordered (%.1f%% fewer)" %
+          (totals[False], totals[True], 100 - 100 * totals[True] / totals[False] if totals[False] else 0))
+    pass
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "search a position, or compare move ordering on the bench positions")
+    parser.add_argument("--fen", default = chessengine.start_fen)
+    parser.add_argument("--depth", type = int, default = 4)
+    parser.add_argument("--time", type = float, default = None, help = "seconds to search")
+    parser.add_argument("--bench", action = "store_true", help = "node counts at --depth with and without move ordering")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    if args.bench:
+        bench(args.depth, args.backend)
+        return 0
+    gs = chessengine.chess_engine.from_fen(args.fen, args.backend)
+    def report(s):
+        print("depth %d score %d nodes %d nps %d" % (s.depth_reached, s.best_score, s.nodes, s.nps))
+    move = searcher(gs).search(args.depth, args.time, on_depth = report)
+    print("bestmove", "none" if move is None else move.get_chess_notation())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+# this file plays engine against engine games without the gui, spread over several processes
+# every game is played to the end on a chess_engine and adjudicated : checkmate, stalemate, the fifty move rule,
+# threefold repetition, too little material left to mate, or a move limit. the games are written to a pgn file
+# a few random moves at the start of each game (seeded by the game number) keep the games apart
+# run it as a script :
+#   python chess_selfplay.py --games 100 --depth 3 --out selfplay.pgn
+#   python chess_selfplay.py --games 20 --time 0.5 --workers 4
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import datetime
+import os
+import random
+import sys
+import time
+
+import chessengine
+import chess_pgn
+import chess_search
+from chess_transposition import transposition_table
+
+engine_name = "chessenginescratch"
+
+worker_state = {} # per process : engine, one searcher per side and the game settings, filled in by init_worker
+
+def init_worker(backend, depth, time_limit, node_limit, max_plies, random_plies, tt_size_mb):
+    # runs once in every worker process, the engine and both transposition tables are reused for all its games
+    gs = chessengine.chess_engine(backend)
+    worker_state["gs"] = gs
+    worker_state["searchers"] = {True:chess_search.searcher(gs, transposition_table(tt_size_mb)),
+                                 False:chess_search.searcher(gs, transposition_table(tt_size_mb))}
+    worker_state["limits"] = (depth, time_limit, node_limit)
+    worker_state["max_plies"] = max_plies
+    worker_state["random_plies"] = random_plies
+    pass
+
+def insufficient_material(gs): # True if neither side has the pieces left to mate : bare kings, or a single knight or bishop
+    pieces = [gs.board[sq >> 3][sq & 7][1] for side in "wb" for sq in gs.piece_squares[side]]
+    pieces.remove("K")
+    pieces.remove("K")
+    return not pieces or (len(pieces) == 1 and pieces[0] in "NB")
+
+def adjudicate(gs, max_plies):
+    # (result, termination) once the game on gs is over, None while it goes on
+    status = gs.get_terminal_status()
+    if status == "checkmate":
+        return ("0-1" if gs.white_to_move else "1-0"), "checkmate"
+    if status == "stalemate":
+        return "1/2-1/2", "stalemate"
+    draw_reason = gs.get_draw_reason()
+    if draw_reason is not None:
+        return "1/2-1/2", draw_reason
+    if insufficient_material(gs):
+        return "1/2-1/2", "insufficient material"
+    if len(gs.move_log) >= max_plies:
+        return "1/2-1/2", "move limit"
+    return None
+
+def play_game(index): # plays game number index in the worker, returns a result dict with its pgn
+
+    gs = worker_state["gs"]
+    searchers = worker_state["searchers"]
+    depth, time_limit, node_limit = worker_state["limits"]
+    gs.load_fen(chessengine.start_fen)
+    for s in searchers.values(): # nothing is carried over from the last game
+        s.tt.clear()
+        s.orderer.clear()
+    gs.move_cache.clear()
+
+    rng = random.Random(index)
+    nodes = 0
+    search_time = 0.0
+    start = time.perf_counter()
+    while True:
+        outcome = adjudicate(gs, worker_state["max_plies"])
+        if outcome is not None:
+            break
+        if len(gs.move_log) < worker_state["random_plies"]:
+            move = rng.choice(gs.get_valid_moves())
+        else:
+            s = searchers[gs.white_to_move]
+            move = s.search(depth, time_limit, node_limit)
+            nodes += s.nodes
+            search_time += s.elapsed
+        gs.make_move(move)
+
+    result, termination = outcome
+    headers = {"Event":"self play", "Site":"?", "Date":datetime.date.today().strftime("%Y.%m.%d"), "Round":str(index + 1),
+               "White":engine_name, "Black":engine_name, "Termination":termination}
+    return {"index":index, "result":result, "termination":termination, "plies":len(gs.move_log), "nodes":nodes,
+            "search_time":search_time, "elapsed":time.perf_counter() - start,
+            "pgn":chess_pgn.game_to_pgn(gs, headers, result)}
+
+def play_games(games, depth = 3, time_limit = None, node_limit = None, workers = None, max_plies = 300, random_plies = 4,
+               backend = "board", tt_size_mb = 16):
+    # yields the result dict of every game as soon as it finishes, games are spread over workers processes (default : one per core)
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers = workers, initializer = init_worker,
+                             initargs = (backend, depth, time_limit, node_limit, max_plies, random_plies, tt_size_mb)) as executor:
+        futures = [executor.submit(play_game, index) for index in range(games)]
+        for future in as_completed(futures):
+            yield future.result()
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "play engine against engine games over several processes and write them as pgn")
+    parser.add_argument("--games", type = int, default = 10)
+    parser.add_argument("--depth", type = int, default = 3, help = "search depth per move")
+    parser.add_argument("--time", type = float, default = None, help = "seconds per move (the depth still caps the search)")
+    parser.add_argument("--nodes", type = int, default = None, help = "node budget per move")
+    parser.add_argument("--max-plies", type = int, default = 300, help = "games this long are adjudicated drawn")
+    parser.add_argument("--random-plies", type = int, default = 4, help = "random moves at the start of each game")
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes (default : one per core)")
+    parser.add_argument("--out", default = "selfplay.pgn")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    scores = {"1-0":0, "0-1":0, "1/2-1/2":0}
+    count = nodes = 0
+    search_time = 0.0
+    with open(args.out, "w") as f:
+        for game in play_games(args.games, args.depth, args.time, args.nodes, args.workers, args.max_plies,
+                               args.random_plies, args.backend):
+            count += 1
+            scores[game["result"]] += 1
+            nodes += game["nodes"]
+            search_time += game["search_time"]
+            f.write(game["pgn"] + "\n")
+            print("game %d : %s (%s) in %d plies, %.1fs" %
+                  (game["index"] + 1, game["result"], game["termination"], game["plies"], game["elapsed"]))
+    elapsed = time.perf_counter() - start
+    print("%d games in %.1fs (%.1f games per hour) : +%d -%d =%d, written to %s" %
+          (count, elapsed, count * 3600 / elapsed if elapsed > 0 else 0, scores["1-0"], scores["0-1"], scores["1/2-1/2"], args.out))
+    print("%d nodes, %d nodes per second per process" % (nodes, nodes / search_time if search_time > 0 else 0))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
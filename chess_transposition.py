@@ -0,0 +1,130 @@
+# this file stores the transposition table used by the search
+# entries live in flat arrays (one per field) instead of a dict of objects, so the table has a fixed size in memory
+# the table is split into buckets of a few slots, a position can only be stored in the bucket its zobrist key maps to
+
+from array import array
+
+# bound types
+exact_bound = 0 # the score is the exact value of the position
+lower_bound = 1 # the search failed high, the real score is at least this
+upper_bound = 2 # the search failed low, the real score is at most this
+
+entry_size = 16 # bytes per slot : key (8) + score (4) + move (2) + depth (1) + bound and generation (1)
+
+class transposition_table():
+
+    def __init__(self, size_mb = 16, replacement = "depth", bucket_size = 2):
+        # replacement picks what happens when a bucket is full :
+        # "depth" keeps the deeper entries and only overwrites one with a search at least as deep (or from an older search)
+        # "always" always overwrites the shallowest entry of the bucket
+        if replacement not in ("depth","always"):
+            raise ValueError("unknown replacement policy : " + str(replacement))
+
+        self.replacement = replacement
+        self.bucket_size = bucket_size
+        self.num_buckets = max(1, int(size_mb * 1024 * 1024) // (entry_size * bucket_size))
+        slots = self.num_buckets * bucket_size
+
+        self.keys = array('Q', bytes(8*slots))   # a key of 0 marks an empty slot
+        self.scores = array('i', bytes(4*slots))
+        self.moves = array('H', bytes(2*slots))  # packed move (see chessengine.encode_move), 0 if none
+        self.depths = array('b', bytes(slots))
+        self.flags = array('B', bytes(slots))    # bound type in the low 2 bits, search generation above it
+        self.generation = 0
+
+        self.reset_stats()
+        pass
+
+    def reset_stats(self):
+        self.probes = 0
+        self.hits = 0
+        self.collisions = 0 # probes that missed while the bucket was full of other positions
+        self.stores = 0
+        self.overwrites = 0 # stores that evicted a different position
+        self.rejected = 0   # stores skipped because the bucket held deeper entries
+        pass
+
+    def clear(self): # empties the table (and its counters), the arrays are zeroed in place and keep their memory
+        for table in (self.keys, self.scores, self.moves, self.depths, self.flags):
+            view = memoryview(table).cast('B')
+            view[:] = bytes(len(view))
+            view.release()
+        self.generation = 0
+        self.reset_stats()
+        pass
+
+    def new_search(self): # called at the start of every search, entries from older searches become the first to be replaced
+        self.generation = (self.generation + 1) & 63
+        pass
+
+    def probe(self, key): # returns (depth, score, bound, move) stored for key, or None
+
+        self.probes += 1
+        keys = self.keys
+        start = (key % self.num_buckets) * self.bucket_size
+        full = True
+        for i in range(start, start + self.bucket_size):
+            if keys[i] == key:
+                self.hits += 1
+                return self.depths[i], self.scores[i], self.flags[i] & 3, self.moves[i]
+            if keys[i] == 0:
+                full = False
+        if full:
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, score, bound, move):
+
+        keys = self.keys
+        depths = self.depths
+        start = (key % self.num_buckets) * self.bucket_size
+
+        # a slot already holding this position is always updated, otherwise the victim is the empty,
+        # stale (older generation) or else shallowest slot of the bucket
+        victim = -1
+        victim_depth = 0
+        for i in range(start, start + self.bucket_size):
+            if keys[i] == key:
+                victim = i
+                break
+            if keys[i] == 0 or self.flags[i] >> 2 != self.generation:
+                slot_depth = -1
+            else:
+                slot_depth = depths[i]
+            if victim == -1 or slot_depth < victim_depth:
+                victim = i
+                victim_depth = slot_depth
+
+        if keys[victim] != key:
+            if self.replacement == "depth" and depth < victim_depth:
+                self.rejected += 1
+                return
+            if keys[victim] != 0:
+                self.overwrites += 1
+        elif move == 0: # keeping the best move of an earlier search of this position if this one has none
+            move = self.moves[victim]
+
+        keys[victim] = key
+        depths[victim] = min(depth, 127)
+        self.scores[victim] = score
+        self.flags[victim] = bound | self.generation << 2
+        self.moves[victim] = move
+        self.stores += 1
+        pass
+
+    @property
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    @property
+    def size_mb(self):
+        return len(self.keys) * entry_size / (1024 * 1024)
+
+    def get_usage(self): # fraction of slots in use
+        used = len(self.keys) - self.keys.count(0)
+        return used / len(self.keys)
+
+    def get_stats(self): # counters for sizing the table
+        return {"size_mb":self.size_mb, "slots":len(self.keys), "probes":self.probes, "hits":self.hits,
+                "hit_rate":self.hit_rate, "collisions":self.collisions, "stores":self.stores,
+                "overwrites":self.overwrites, "rejected":self.rejected}
@@ -0,0 +1,237 @@
+# this file runs the engine as a uci engine over stdin/stdout, so it can be used from chess guis and tournament managers
+# the search runs on a worker thread while this thread keeps reading commands, so stop and isready are
+# answered straight away. the worker reports every finished depth with an info line and ends with bestmove
+# run it with :
+#   python chess_uci.py --backend board
+
+import argparse
+import sys
+import threading
+
+import chessengine
+import chess_search
+from chess_transposition import transposition_table
+
+engine_name = "chessenginescratch"
+engine_author = "johrikeshav"
+
+default_hash_mb = 16
+max_hash_mb = 1024
+default_moves_to_go = 30 # moves the remaining clock time is spread over when the gui doesn't say
+move_overhead = 0.05     # seconds kept back from every move for the gui and the pipe
+
+def time_for_move(time_left, increment = 0.0, moves_to_go = None):
+    # seconds to search with time_left (and increment) on the clock, never more than half of what is left
+    moves_to_go = moves_to_go or default_moves_to_go
+    budget = time_left / moves_to_go + increment * 0.8
+    return max(0.01, min(budget, time_left / 2) - move_overhead)
+
+def parse_go(tokens, white_to_move):
+    # (max depth, time limit in seconds, node limit, infinite) from the words after go
+    # the clock settings only count for the side to move, movetime beats them
+    values = {}
+    infinite = False
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "infinite":
+            infinite = True
+        elif token in ("depth","movetime","wtime","btime","winc","binc","movestogo","nodes") and i+1 < len(tokens):
+            try:
+                values[token] = int(tokens[i+1])
+            except ValueError: # a field that isn't a number is ignored
+                pass
+            i += 1
+        i += 1
+
+    # the search keeps a move list and killers per ply, so it can't go deeper than max_ply - 1
+    max_depth = min(max(values.get("depth", chess_search.max_ply - 1), 1), chess_search.max_ply - 1)
+    node_limit = values.get("nodes")
+    time_limit = None
+    if "movetime" in values:
+        time_limit = max(0.01, values["movetime"] / 1000 - move_overhead)
+    elif not infinite:
+        time_left = values.get("wtime" if white_to_move else "btime")
+        if time_left is not None:
+            increment = values.get("winc" if white_to_move else "binc", 0)
+            time_limit = time_for_move(time_left / 1000, increment / 1000, values.get("movestogo"))
+    return max_depth, time_limit, node_limit, infinite
+
+def format_score(score): # uci score field : centipawns, or mate in moves (negative if the engine is the one being mated)
+    if score >= chess_search.mate_score - chess_search.max_ply:
+        return "mate %d" % ((chess_search.mate_score - score + 1) // 2)
+    if score <= -chess_search.mate_score + chess_search.max_ply:
+        return "mate -%d" % ((chess_search.mate_score + score) // 2)
+    return "cp %d" % score
+
+class uci_engine():
+
+    def __init__(self, backend = "board", output = None):
+        self.backend = backend
+        self.output = output if output is not None else sys.stdout
+        self.output_lock = threading.Lock() # the worker and the command loop both write
+        self.gs = chessengine.chess_engine(backend)
+        self.searcher = chess_search.searcher(self.gs, transposition_table(default_hash_mb))
+        self.position = (chessengine.start_fen, []) # fen and moves of the last position set up without error
+        self.worker = None
+        self.stop_signal = threading.Event() # an infinite search waits on this before sending bestmove
+        pass
+
+    def send(self, line):
+        with self.output_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+        pass
+
+    def handle(self, line): # runs one command, returns False once the engine should quit
+        # commands that change the position or the search settings end a running search first,
+        # waiting alone would hang on go infinite, which only finishes once it is stopped
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+
+        if command == "uci":
+            self.send("id name " + engine_name)
+            self.send("id author " + engine_author)
+            self.send("option name Hash type spin default %d min 1 max %d" % (default_hash_mb, max_hash_mb))
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.stop_search()
+            self.wait_for_search()
+            self.set_option(tokens[1:])
+        elif command == "ucinewgame":
+            self.stop_search()
+            self.wait_for_search()
+            self.searcher.tt.clear()
+            self.searcher.orderer.clear()
+            self.gs.move_cache.clear()
+        elif command == "position":
+            self.stop_search()
+            self.wait_for_search()
+            try:
+                self.set_position(tokens[1:])
+            except Exception as e: # a bad position is reported, the engine goes back to the last good one
+                self.send("info string bad position : " + str(e))
+                self.play_position(*self.position)
+        elif command == "go":
+            self.stop_search()
+            self.wait_for_search()
+            self.start_search(tokens[1:])
+        elif command == "stop":
+            self.stop_search()
+            self.wait_for_search()
+        elif command == "quit":
+            self.stop_search()
+            self.wait_for_search()
+            return False
+        return True
+
+    def set_option(self, tokens): # setoption name <name> value <value>
+        if "name" not in tokens or "value" not in tokens:
+            return
+        name = " ".join(tokens[tokens.index("name")+1:tokens.index("value")]).lower()
+        value = " ".join(tokens[tokens.index("value")+1:])
+        if name == "hash":
+            try:
+                size_mb = min(max(int(value), 1), max_hash_mb)
+            except ValueError:
+                return
+            self.searcher.tt = transposition_table(size_mb)
+        pass
+
+    def set_position(self, tokens): # position startpos|fen <fen> [moves <move> ...], raises ValueError for a bad one
+        if "moves" in tokens:
+            moves = tokens[tokens.index("moves")+1:]
+            tokens = tokens[:tokens.index("moves")]
+        else:
+            moves = []
+        if tokens and tokens[0] == "startpos":
+            fen = chessengine.start_fen
+        elif tokens and tokens[0] == "fen":
+            fen = " ".join(tokens[1:])
+        else:
+            raise ValueError("position needs startpos or fen")
+        self.play_position(fen, moves)
+        self.position = (fen, moves)
+        pass
+
+    def play_position(self, fen, moves): # loads fen and plays the coordinate moves on it, raises ValueError at an illegal one
+        gs = self.gs
+        gs.load_fen(fen)
+        for notation in moves:
+            for move in gs.get_valid_moves():
+                if move.get_chess_notation() == notation:
+                    gs.make_move(move)
+                    break
+            else:
+                raise ValueError("illegal move " + notation)
+        pass
+
+    def start_search(self, tokens):
+        max_depth, time_limit, node_limit, infinite = parse_go(tokens, self.gs.white_to_move)
+        self.stop_signal.clear()
+        self.searcher.stopped = False # cleared here, before the worker starts, so a stop sent right after go isn't lost
+        self.worker = threading.Thread(target = self.search, args = (max_depth, time_limit, node_limit, infinite), daemon = True)
+        self.worker.start()
+        pass
+
+    def search(self, max_depth, time_limit, node_limit, infinite): # runs on the worker thread
+        # bestmove is always sent, even if the search fails, so the gui is never left waiting for it
+        move = None
+        try:
+            move = self.searcher.search(max_depth, time_limit, node_limit, on_depth = self.send_info)
+            if infinite: # go infinite only ends with stop, even if the search finished (or found a mate) before
+                self.stop_signal.wait()
+        except Exception as e:
+            self.send("info string search failed : " + repr(e))
+        finally:
+            self.send("bestmove " + ("0000" if move is None else move.get_chess_notation()))
+        pass
+
+    def send_info(self, s): # called by the searcher after every finished depth
+        line = " ".join(self.pv_notation(s.principal_variation()))
+        self.send("info depth %d score %s nodes %d nps %d time %d pv %s" %
+                  (s.depth_reached, format_score(s.best_score), s.nodes, s.nps, int(s.elapsed * 1000), line))
+        pass
+
+    def pv_notation(self, pv): # coordinate notation of a line of move codes from the current position
+        gs = self.gs
+        notations = []
+        for code in pv:
+            move = chessengine.Move.from_code(code, gs.board)
+            notations.append(move.get_chess_notation())
+            gs.make_move(move)
+        for code in pv:
+            gs.undo_move()
+        return notations
+
+    def stop_search(self):
+        self.searcher.stop()
+        self.stop_signal.set()
+        pass
+
+    def wait_for_search(self): # lets a running search finish (it has sent bestmove once this returns)
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        pass
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "run the engine as a uci engine on stdin/stdout")
+    parser.add_argument("--backend", default = "board", choices = ("board","bitboard"))
+    args = parser.parse_args(argv)
+
+    engine = uci_engine(args.backend)
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    else: # stdin closed without quit
+        engine.stop_search()
+        engine.wait_for_search()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
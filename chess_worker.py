@@ -0,0 +1,119 @@
+# this file runs the engine's slow work for the gui on a background thread : legal move generation and engine searches
+# the gui puts jobs on a queue and picks the results up from another queue when they are ready, so it keeps
+# drawing and reading input while the engine thinks
+# the worker has its own chess_engine : every job carries the game (start fen and moves played), the worker
+# replays it on its engine, so the gui's engine is never touched from the worker thread
+
+import queue
+import threading
+import time
+
+import chessengine
+import chess_book
+import chess_search
+
+def get_game(gs): # (start fen, move codes) of the game played on gs, what a job needs to set the position up again
+    moves = list(gs.move_log)
+    for move in moves: # going back to the start position for its fen, as chess_pgn.game_to_pgn does
+        gs.undo_move()
+    start_fen = gs.to_fen()
+    for move in moves:
+        gs.make_move(move)
+    return start_fen, [move.code for move in moves]
+
+class engine_worker():
+
+    def __init__(self, backend = "board", book_path = None):
+        self.gs = chessengine.chess_engine(backend)
+        self.searcher = chess_search.searcher(self.gs)
+        self.book = chess_book.open_book(book_path) if book_path is not None else None
+        self.jobs = queue.Queue()
+        self.results = queue.Queue()
+        self.last_job = 0
+        self.cancelled_job = 0 # jobs up to this id are searched no further (or not at all if they haven't started)
+        self.cancel_lock = threading.Lock()
+        self.searching = False
+        self.search_start = 0.0
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+        pass
+
+    def request_moves(self, gs):
+        # queues the legal moves of the position on gs, the result is ("moves", job id, list of Moves, checkmate, stalemate, draw reason)
+        return self.submit("moves", gs, None)
+
+    def request_search(self, gs, time_limit):
+        # queues a search (or book move) for the position on gs, the result is ("search", job id, Move or None, description)
+        return self.submit("search", gs, time_limit)
+
+    def submit(self, kind, gs, time_limit): # returns the job id its result will carry
+        self.last_job += 1
+        self.jobs.put((self.last_job, kind, get_game(gs), time_limit))
+        return self.last_job
+
+    def cancel(self, job_id): # stops a search job, it still sends a result with the best move found so far (None if it never started)
+        with self.cancel_lock:
+            self.cancelled_job = max(self.cancelled_job, job_id)
+            self.searcher.stop()
+        pass
+
+    def get_result(self): # the next finished job's result, or None if there isn't one yet (never blocks)
+        try:
+            return self.results.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get_progress(self): # (depth, nodes, nps) of the running search, None when not searching
+        if not self.searching:
+            return None
+        s = self.searcher
+        elapsed = time.perf_counter() - self.search_start
+        return s.depth_reached, s.nodes, int(s.nodes / elapsed) if elapsed > 0 else 0
+
+    def close(self):
+        self.cancel(self.last_job)
+        self.jobs.put(None)
+        pass
+
+    def run(self): # the worker thread, one job at a time until close
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            job_id, kind, game, time_limit = job
+            try:
+                self.set_up_game(game)
+                if kind == "moves":
+                    moves = self.gs.get_valid_moves()
+                    self.results.put(("moves", job_id, moves, self.gs.checkmate, self.gs.stalemate, self.gs.get_draw_reason()))
+                else:
+                    self.results.put(("search", job_id) + self.search(job_id, time_limit))
+            except Exception as e: # a failed job sends ("error", job id, kind, message) and the worker goes on with the next one
+                self.results.put(("error", job_id, kind, repr(e)))
+        pass
+
+    def set_up_game(self, game): # replays a game on the worker's engine, so repetitions before the position count too
+        start_fen, codes = game
+        gs = self.gs
+        gs.load_fen(start_fen)
+        for code in codes:
+            gs.make_move(chessengine.Move.from_code(code, gs.board))
+        pass
+
+    def search(self, job_id, time_limit): # (Move, description) for the position on the worker's engine
+
+        gs = self.gs
+        move = self.book.choose_move(gs) if self.book is not None else None
+        if move is not None:
+            return move, "book"
+
+        with self.cancel_lock: # a cancel that came in before the job started still counts
+            self.searcher.stopped = job_id <= self.cancelled_job
+        self.search_start = time.perf_counter()
+        self.searching = True
+        try:
+            move = self.searcher.search(time_limit = time_limit)
+        finally:
+            self.searching = False
+        s = self.searcher
+        return move, "depth %d nodes %d nps %d" % (s.depth_reached, s.nodes, s.nps)
@@ -2,8 +2,143 @@
 # we store all valid moves here 
 # we also store a move log in here
 
+from array import array
+from collections import OrderedDict
+import random
+
+import chess_evaluation
+
+# moves are generated as 16 bit ints and only turned into Move objects when they are needed
+# bits 0-5 : start square, bits 6-11 : end square (a square is row*8 + col)
+# bits 12-13 : move type, bits 14-15 : promotion piece (index into promotion_pieces)
+move_flag_mask = 3 << 12
+enpassant_flag = 1 << 12
+castling_flag = 2 << 12
+promotion_flag = 3 << 12
+promotion_pieces = "NBRQ"
+promotion_codes = tuple(promotion_flag | promotion_pieces.index(piece) << 14 for piece in "QNRB") # queen first
+
+def encode_move(start_sq, end_sq, flag = 0, promotion_piece = "Q"): # packs a move into an int
+    if flag == promotion_flag:
+        return start_sq | end_sq << 6 | flag | promotion_pieces.index(promotion_piece) << 14
+    return start_sq | end_sq << 6 | flag
+
+# zobrist hashing : a position's key is the xor of one random 64 bit number per (piece, square), one for the
+# castling rights, one for the en passant file and one if black is to move, so a move only has to xor in what it changes
+# the generator is seeded so keys are the same in every run (and can be stored, eg in an opening book)
+zobrist_random = random.Random(20240611)
+zobrist_pieces = {piece:[zobrist_random.getrandbits(64) for sq in range(64)] for piece in
+                  ("wP","wR","wN","wB","wQ","wK","bP","bR","bN","bB","bQ","bK")}
+zobrist_castling = [zobrist_random.getrandbits(64) for mask in range(16)] # indexed by the castling rights mask
+zobrist_enpassant = [zobrist_random.getrandbits(64) for col in range(8)] # indexed by the file of the en passant square
+zobrist_black_to_move = zobrist_random.getrandbits(64)
+
+def add_pawn_move(moves, code, promoting): # a pawn move onto the last row is added once for every piece it can promote to
+    if promoting:
+        for promotion in promotion_codes:
+            moves.append(code | promotion)
+    else:
+        moves.append(code)
+
+# castling rights are kept as a 4 bit mask
+white_king_side = 1
+white_queen_side = 2
+black_king_side = 4
+black_queen_side = 8
+
+# the rights that survive a move from or to each square, moving a king or a rook or capturing a rook on its
+# home square takes the right away, so one lookup per square replaces checking which piece moved
+castling_rights_mask = [15]*64
+castling_rights_mask[7*8+4] = 15 & ~(white_king_side | white_queen_side) # e1
+castling_rights_mask[7*8+7] = 15 & ~white_king_side                      # h1
+castling_rights_mask[7*8+0] = 15 & ~white_queen_side                     # a1
+castling_rights_mask[0*8+4] = 15 & ~(black_king_side | black_queen_side) # e8
+castling_rights_mask[0*8+7] = 15 & ~black_king_side                      # h8
+castling_rights_mask[0*8+0] = 15 & ~black_queen_side                     # a8
+
+# make_move pushes the state a move can't give back on the undo stack as one int :
+# bits 0-3 castling rights, bits 4-10 en passant square (64 if none), bits 11-14 captured piece, bits 15-30 halfmove clock
+piece_codes = ("__","wP","wR","wN","wB","wQ","wK","bP","bR","bN","bB","bQ","bK")
+piece_index = {piece:index for index, piece in enumerate(piece_codes)}
+square_locations = [(row,col) for row in range(8) for col in range(8)] + [()] # shared (row, col) tuples, 64 -> no square
+
+# the first four directions are orthogonal (rooks), the last four diagonal (bishops)
+move_directions = ((-1,0),(0,-1),(1,0),(0,1),(-1,-1),(-1,1),(1,-1),(1,1))
+knight_offsets = ((-2,-1),(-2,1),(-1,-2),(-1,2),(1,-2),(1,2),(2,-1),(2,1))
+rook_directions = (0,1,2,3)
+bishop_directions = (4,5,6,7)
+queen_directions = (0,1,2,3,4,5,6,7)
+
+# precomputed targets, built once at import so the generators never test for the edge of the board
+# every target is (row, col, square << 6), the square already shifted into the end square bits of a packed move
+def build_targets(row, col, offsets): # squares one jump away from (row, col) that are on the board
+    return tuple((row+dir_row, col+dir_col, ((row+dir_row)*8 + col+dir_col) << 6) for dir_row, dir_col in offsets
+                 if 0 <= row+dir_row <= 7 and 0 <= col+dir_col <= 7)
+
+def build_ray(row, col, dir_row, dir_col): # squares from (row, col) up to the edge in one direction, nearest first
+    ray = []
+    r = row + dir_row
+    c = col + dir_col
+    while 0 <= r <= 7 and 0 <= c <= 7:
+        ray.append((r, c, (r*8 + c) << 6))
+        r += dir_row
+        c += dir_col
+    return tuple(ray)
+
+knight_targets = [build_targets(sq >> 3, sq & 7, knight_offsets) for sq in range(64)]
+king_targets = [build_targets(sq >> 3, sq & 7, move_directions) for sq in range(64)]
+ray_targets = [[build_ray(sq >> 3, sq & 7, dir_row, dir_col) for dir_row, dir_col in move_directions] for sq in range(64)]
+# square_lines[a][b] : the direction (index into move_directions) to go from a to reach b, 8 if b is a knight jump away, otherwise -1
+# attack checks go over the enemy pieces and use this to skip every piece that isn't on a line with the square at all
+square_lines = [[-1]*64 for sq in range(64)]
+for sq in range(64):
+    for d in range(8):
+        for r, c, end in ray_targets[sq][d]:
+            square_lines[sq][end >> 6] = d
+    for r, c, end in knight_targets[sq]:
+        square_lines[sq][end >> 6] = 8
+adjacent_squares = [{end >> 6 for r, c, end in king_targets[sq]} for sq in range(64)]
+
+# the directions from a square towards a piece that attacks it, for every piece type that slides or steps in them
+# (a black pawn attacks a square from above it, a white pawn from below it)
+line_attackers = [{"R","Q"}]*4 + [{"B","Q"}]*4
+pawn_attack_directions = {"b":(4,5), "w":(6,7)}
+
+pin_allows = [(None, (dir_row,dir_col), (-dir_row,-dir_col)) for dir_row, dir_col in move_directions] # pins a ray direction can move along
+
+# fen (Forsyth-Edwards Notation) letters for every piece, white in upper case and black in lower case
+start_fen = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+fen_to_piece = {"P":"wP","R":"wR","N":"wN","B":"wB","Q":"wQ","K":"wK","p":"bP","r":"bR","n":"bN","b":"bB","q":"bQ","k":"bK"}
+piece_to_fen = {value:key for key, value in fen_to_piece.items()}
+fen_empty_runs = {str(n):["__"]*n for n in range(1,9)} # a digit in a fen rank is that many empty squares
+
+def king_can_be_captured(board, white_to_move): # True if the side not to move is in check on board (an impossible position)
+    # the attack test only reads board, white_to_move and piece_squares, so it runs on a bare position object
+    position = object.__new__(chess_engine)
+    position.board = board
+    position.white_to_move = not white_to_move
+    position.piece_squares = chess_engine.find_piece_squares(position)
+    for row in range(8):
+        for col in range(8):
+            if board[row][col] == ("b" if white_to_move else "w") + "K":
+                return chess_engine.square_under_attack(position, row, col)
+    return False
+
 class chess_engine():
-    def __init__(self):
+
+    directions = move_directions
+    knight_directions = knight_offsets
+
+    def __new__(cls, backend = "board", fen = None): # backend picks the position representation, "board" or "bitboard"
+        
+        if cls is chess_engine and backend == "bitboard":
+            import chess_bitboard # imported here since the bitboard backend subclasses this class
+            cls = chess_bitboard.bitboard_engine
+        elif backend not in ("board","bitboard"):
+            raise ValueError("unknown backend : " + str(backend))
+        return super().__new__(cls)
+
+    def __init__(self, backend = "board", fen = None): # starts from fen if given, otherwise from the starting position
         
         # board is a 2D 8x8 list
         # blank spaces are represented by __
@@ -23,6 +158,7 @@ class chess_engine():
         
         self.move_functions = {'P':self.get_pawn_moves,'R':self.get_rook_moves,'N':self.get_knight_moves,
                                'B':self.get_bishop_moves,'Q':self.get_queen_moves,'K':self.get_king_moves}
+        self.backend = backend
         self.white_to_move = True 
         self.move_log = [] # storing all previous moves in a list
     
@@ -34,82 +170,376 @@ class chess_engine():
 
         self.enpassant_possible = ()
 
-        self.current_castling_rights = castling_rights(True,True,True,True)
-        self.castling_rights_log = [castling_rights(self.current_castling_rights.white_king_side,self.current_castling_rights.black_king_side
-                                                   ,self.current_castling_rights.white_queen_side,self.current_castling_rights.black_queen_side)]
+        self.pins = {} # pieces pinned to the king while legal moves are generated, (row, col) -> pin direction
+
+        self.castling_rights = white_king_side | white_queen_side | black_king_side | black_queen_side
+
+        # halfmoves since the last capture or pawn move (for the fifty move rule) and the move number, as in a fen
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+
+        # one entry per move made : the packed state from before the move (see piece_codes) and the zobrist key after it
+        self.undo_stack = array('L')
+        self.zobrist_log = array('Q',[self.compute_zobrist_key()]) # zobrist key of every position reached, the last one is the current position
+
+        self.move_cache = move_cache() # legal moves of recently seen positions, for get_valid_moves
+
+        # the squares (row*8 + col) each side has pieces on, kept up to date by make_move/undo_move so the
+        # generators only visit occupied squares
+        self.piece_squares = self.find_piece_squares()
+
+        # running evaluation totals from white's point of view, kept up to date by make_move/undo_move (see chess_evaluation)
+        self.mg_score, self.eg_score, self.phase = chess_evaluation.board_scores(self.board)
+
+        if fen is not None:
+            self.load_fen(fen)
+
+    @classmethod
+    def from_fen(cls, fen, backend = "board"): # a new engine set up with the position in fen
+        return cls(backend, fen)
+
+    def load_fen(self, fen): # replaces the current position (and clears the move history) with the one in fen
+        # every field is read and checked before anything is changed, a bad fen raises ValueError and leaves the engine as it was
+
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("fen needs at least board, side to move, castling and en passant fields : " + fen)
+
+        board = []
+        for rank in fields[0].split("/"):
+            row = []
+            for char in rank:
+                if char in fen_empty_runs:
+                    row += fen_empty_runs[char]
+                elif char in fen_to_piece:
+                    row.append(fen_to_piece[char])
+                else:
+                    raise ValueError("unknown piece in fen : " + char)
+            if len(row) != 8:
+                raise ValueError("fen rank does not have 8 squares : " + rank)
+            board.append(row)
+        if len(board) != 8:
+            raise ValueError("fen board does not have 8 ranks : " + fields[0])
+
+        white_king_location = black_king_location = ()
+        for row in range(8):
+            if "wK" in board[row]:
+                white_king_location = (row,board[row].index("wK"))
+            if "bK" in board[row]:
+                black_king_location = (row,board[row].index("bK"))
+        if white_king_location == () or black_king_location == ():
+            raise ValueError("fen needs a king of each colour : " + fields[0])
+        if sum(row.count("wK") for row in board) > 1 or sum(row.count("bK") for row in board) > 1:
+            raise ValueError("fen has more than one king of a colour : " + fields[0])
+        if any(piece[1] == "P" for piece in board[0] + board[7]):
+            raise ValueError("fen has a pawn on the first or last rank : " + fields[0])
+
+        if fields[1] not in ("w","b"):
+            raise ValueError("fen side to move must be w or b : " + fields[1])
+        white_to_move = fields[1] == "w"
+        if king_can_be_captured(board, white_to_move):
+            raise ValueError("fen has the side not to move in check : " + fen)
+
+        rights = fields[2]
+        if rights != "-" and (not rights or any(char not in "KQkq" for char in rights)):
+            raise ValueError("fen castling rights must be - or letters from KQkq : " + rights)
+        castling_rights = 0
+        for char, right, row, rook_col, color in (("K",white_king_side,7,7,"w"), ("Q",white_queen_side,7,0,"w"),
+                                                  ("k",black_king_side,0,7,"b"), ("q",black_queen_side,0,0,"b")):
+            # a right is only kept if its king and rook are still on their starting squares
+            if char in rights and board[row][4] == color + "K" and board[row][rook_col] == color + "R":
+                castling_rights |= right
+
+        ep = fields[3]
+        if ep != "-" and (len(ep) != 2 or ep[0] not in Move.files_to_cols or ep[1] not in Move.ranks_to_rows):
+            raise ValueError("fen en passant square must be - or a square : " + ep)
+        enpassant_possible = ()
+        if ep != "-":
+            # the square a pawn of the side not to move has just passed over : on the 6th rank with white to move,
+            # the 3rd with black to move, empty and with the pushed pawn in front of it. any other square is ignored
+            ep_row = Move.ranks_to_rows[ep[1]]
+            ep_col = Move.files_to_cols[ep[0]]
+            pawn_row, pawn = (3, "bP") if white_to_move else (4, "wP")
+            if ep_row == pawn_row + (-1 if white_to_move else 1) and board[ep_row][ep_col] == "__" and board[pawn_row][ep_col] == pawn:
+                enpassant_possible = square_locations[ep_row*8 + ep_col]
+
+        try:
+            halfmove_clock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove_number = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError("fen move counters must be numbers : " + " ".join(fields[4:6])) from None
+        if halfmove_clock < 0 or fullmove_number < 1:
+            raise ValueError("fen move counters out of range : " + " ".join(fields[4:6]))
+
+        self.board = board
+        self.white_king_location = white_king_location
+        self.black_king_location = black_king_location
+        self.white_to_move = white_to_move
+        self.castling_rights = castling_rights
+        self.enpassant_possible = enpassant_possible
+        self.halfmove_clock = halfmove_clock
+        self.fullmove_number = fullmove_number
+
+        self.move_log = []
+        self.checkmate = False
+        self.stalemate = False
+        self.pins = {}
+        self.undo_stack = array('L')
+        self.zobrist_log = array('Q',[self.compute_zobrist_key()])
+        self.mg_score, self.eg_score, self.phase = chess_evaluation.board_scores(self.board)
+        self.piece_squares = self.find_piece_squares()
+        pass
+
+    def to_fen(self): # the current position as a fen string
+        
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for piece in row:
+                if piece == "__":
+                    empty += 1
+                else:
+                    if empty:
+                        rank += str(empty)
+                        empty = 0
+                    rank += piece_to_fen[piece]
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        rights = self.castling_rights
+        castling = ("K" if rights & white_king_side else "") + ("Q" if rights & white_queen_side else "") + \
+                   ("k" if rights & black_king_side else "") + ("q" if rights & black_queen_side else "")
+        if self.enpassant_possible == ():
+            enpassant = "-"
+        else:
+            enpassant = Move.cols_to_files[self.enpassant_possible[1]] + Move.rows_to_ranks[self.enpassant_possible[0]]
+
+        return " ".join(("/".join(ranks), "w" if self.white_to_move else "b", castling or "-", enpassant,
+                         str(self.halfmove_clock), str(self.fullmove_number)))
+        pass
+
+    @property
+    def zobrist_key(self): # 64 bit key identifying the current position, kept up to date by make_move and undo_move
+        return self.zobrist_log[-1]
+
+    def compute_zobrist_key(self): # computes the zobrist key of the current position from scratch
+        
+        key = 0
+        sq = 0
+        for row in self.board:
+            for piece in row:
+                if piece != "__":
+                    key ^= zobrist_pieces[piece][sq]
+                sq += 1
+        key ^= zobrist_castling[self.castling_rights]
+        if self.enpassant_possible != ():
+            key ^= zobrist_enpassant[self.enpassant_possible[1]]
+        if not self.white_to_move:
+            key ^= zobrist_black_to_move
+        return key
+        pass
+    def find_piece_squares(self): # {"w":set of squares, "b":set of squares} from a scan of the board
+        piece_squares = {"w":set(), "b":set()}
+        for row in range(8):
+            for col in range(8):
+                if self.board[row][col] != "__":
+                    piece_squares[self.board[row][col][0]].add(row*8 + col)
+        return piece_squares
+
+    def is_repetition(self, times = 1): # True if the current position has already been reached at least times before
+        # a capture or pawn move can never be undone, so only the positions since the last one (the halfmove clock)
+        # are compared, and only those with the same side to move (every other one)
+        key = self.zobrist_log[-1]
+        last = len(self.zobrist_log) - 1
+        oldest = max(last - self.halfmove_clock, 0)
+        seen = 0
+        for i in range(last - 4, oldest - 1, -2): # a position can first repeat four plies later
+            if self.zobrist_log[i] == key:
+                seen += 1
+                if seen >= times:
+                    return True
+        return False
+
+    def get_draw_reason(self): # "fifty move rule", "threefold repetition" or None, the draws a player can claim
+        # checkmate on the move that reaches the fifty move limit still wins, so call this after get_valid_moves
+        if self.halfmove_clock >= 100 and not self.checkmate:
+            return "fifty move rule"
+        if self.is_repetition(2):
+            return "threefold repetition"
+        return None
 
     def make_move(self,move): # takes a move and executes it(no work for castling, en-passant & promotion)
         
+        # saving what the move itself can't give back onto the undo stack, one int per move
+        if self.enpassant_possible == ():
+            enpassant_sq = 64
+        else:
+            enpassant_sq = self.enpassant_possible[0]*8 + self.enpassant_possible[1]
+        self.undo_stack.append(self.castling_rights | enpassant_sq << 4 | piece_index[move.piece_captured] << 11 | min(self.halfmove_clock,0xFFFF) << 15)
+
         self.board[move.start_row][move.start_col] = "__"         # removing piece from original pos
         self.board[move.end_row][move.end_col] = move.piece_moved # moving the piece to new pos
         self.move_log.append(move)                                # logging the move 
         self.white_to_move = not self.white_to_move               # switching turns
+
+        # move clocks, the halfmove clock restarts on every capture or pawn move
+        if move.piece_moved[1] == "P" or move.piece_captured != "__":
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if self.white_to_move: # black just moved
+            self.fullmove_number += 1
+
+        # updating the zobrist key with only what the move changes
+        start_sq = move.start_row*8 + move.start_col
+        end_sq = move.end_row*8 + move.end_col
+        key = self.zobrist_log[-1] ^ zobrist_black_to_move ^ zobrist_pieces[move.piece_moved][start_sq]
+        if move.piece_captured != "__" and not move.is_enpassant_move:
+            key ^= zobrist_pieces[move.piece_captured][end_sq]
     
         # updating the king's location if moves
         if move.piece_moved[1] == "K":     # checking if a king moved
             if move.piece_moved[0] == "w": # white king moved        
-                self.white_king_location = (move.end_row,move.end_col)
+                self.white_king_location = square_locations[end_sq]
             else:                          # black king moved
-                self.black_king_location = (move.end_row,move.end_col)
+                self.black_king_location = square_locations[end_sq]
 
         # pawn promotion
         if move.is_pawn_promotion:
-            self.board[move.end_row][move.end_col] = move.piece_moved[0] + 'Q' # TO DO : allow for promotion to R/N/B/Q and generate valid moves for all those in testing as well
+            self.board[move.end_row][move.end_col] = move.piece_moved[0] + move.promotion_piece
+        key ^= zobrist_pieces[self.board[move.end_row][move.end_col]][end_sq]
         
         # en passant
         if move.is_enpassant_move:
             self.board[move.start_row][move.end_col] = "__"
+            key ^= zobrist_pieces[move.piece_captured][move.start_row*8 + move.end_col]
 
+        if self.enpassant_possible != ():
+            key ^= zobrist_enpassant[self.enpassant_possible[1]]
         if move.piece_moved[1] == "P" and abs(move.start_row-move.end_row) == 2:
-            self.enpassant_possible = ((move.start_row+move.end_row)//2,move.start_col)
+            self.enpassant_possible = square_locations[(start_sq+end_sq)//2]
+            key ^= zobrist_enpassant[move.start_col]
         else:
             self.enpassant_possible = ()
         
-        # castling rights (need to be updated whenever king/rook moves)
-        self.update_castling_rights(move)    
-        self.castling_rights_log.append(castling_rights(self.current_castling_rights.white_king_side,self.current_castling_rights.black_king_side
-                                                   ,self.current_castling_rights.white_queen_side,self.current_castling_rights.black_queen_side))
+        # castling rights (need to be updated whenever king/rook moves or a rook is captured)
+        key ^= zobrist_castling[self.castling_rights]
+        self.castling_rights &= castling_rights_mask[start_sq] & castling_rights_mask[end_sq]
+        key ^= zobrist_castling[self.castling_rights]
         
         # making the castling move
         if move.is_castling_move:
 
+            rook = zobrist_pieces[move.piece_moved[0] + "R"]
             if move.end_col-move.start_col == 2: # this is a king side castle
                 self.board[move.end_row][move.end_col-1] = self.board[move.end_row][move.end_col+1] # placing a rook beside the king
                 self.board[move.end_row][move.end_col+1] = "__"     # removing the king side rook
+                key ^= rook[end_sq-1] ^ rook[end_sq+1]
 
             else: # this is a queen side castle
                 self.board[move.end_row][move.end_col+1] = self.board[move.end_row][move.end_col-2] # placing a rook beside the king 
                 self.board[move.end_row][move.end_col-2] = "__"     # removing the queen side rook 
+                key ^= rook[end_sq+1] ^ rook[end_sq-2]
+
+        self.zobrist_log.append(key)
+        self.update_scores(move, 1)
+        self.move_piece_squares(move, True)
+        pass
+
+    def move_piece_squares(self, move, forward): # updates the piece square sets for a move being made (forward) or undone
+        start_sq = move.start_row*8 + move.start_col
+        end_sq = move.end_row*8 + move.end_col
+        own = self.piece_squares[move.piece_moved[0]]
+        if forward:
+            own.remove(start_sq)
+            own.add(end_sq)
+        else:
+            own.remove(end_sq)
+            own.add(start_sq)
 
+        if move.piece_captured != "__":
+            captured_sq = move.start_row*8 + move.end_col if move.is_enpassant_move else end_sq
+            if forward:
+                self.piece_squares[move.piece_captured[0]].remove(captured_sq)
+            else:
+                self.piece_squares[move.piece_captured[0]].add(captured_sq)
+
+        if move.is_castling_move:
+            if move.end_col - move.start_col == 2: # king side, the rook goes from the corner to the left of the king
+                rook_from, rook_to = end_sq+1, end_sq-1
+            else:                                  # queen side, the rook goes from the corner to the right of the king
+                rook_from, rook_to = end_sq-2, end_sq+1
+            if not forward:
+                rook_from, rook_to = rook_to, rook_from
+            own.remove(rook_from)
+            own.add(rook_to)
+        pass
+
+    def update_scores(self, move, sign): # adds (sign 1) or takes back (sign -1) what a move changes in the evaluation totals
+
+        mg_table = chess_evaluation.mg_table
+        eg_table = chess_evaluation.eg_table
+        start_sq = move.start_row*8 + move.start_col
+        end_sq = move.end_row*8 + move.end_col
+        placed = move.piece_moved[0] + move.promotion_piece if move.is_pawn_promotion else move.piece_moved
+
+        mg = mg_table[placed][end_sq] - mg_table[move.piece_moved][start_sq]
+        eg = eg_table[placed][end_sq] - eg_table[move.piece_moved][start_sq]
+        phase = chess_evaluation.phase_table[placed] - chess_evaluation.phase_table[move.piece_moved]
+
+        if move.piece_captured != "__":
+            captured_sq = move.start_row*8 + move.end_col if move.is_enpassant_move else end_sq
+            mg -= mg_table[move.piece_captured][captured_sq]
+            eg -= eg_table[move.piece_captured][captured_sq]
+            phase -= chess_evaluation.phase_table[move.piece_captured]
+
+        if move.is_castling_move:
+            rook = move.piece_moved[0] + "R"
+            if move.end_col - move.start_col == 2: # king side, the rook goes from the corner to the left of the king
+                rook_from, rook_to = end_sq+1, end_sq-1
+            else:                                  # queen side, the rook goes from the corner to the right of the king
+                rook_from, rook_to = end_sq-2, end_sq+1
+            mg += mg_table[rook][rook_to] - mg_table[rook][rook_from]
+            eg += eg_table[rook][rook_to] - eg_table[rook][rook_from]
+
+        self.mg_score += sign * mg
+        self.eg_score += sign * eg
+        self.phase += sign * phase
         pass
 
     def undo_move(self): # reverses the last move
         if len(self.move_log) != 0:
             last_move = self.move_log.pop()
-            self.board[last_move.end_row][last_move.end_col] = last_move.piece_captured  # replacing the captured piece 
+            state = self.undo_stack.pop() # castling rights, en passant square, captured piece and halfmove clock from before the move
+            self.zobrist_log.pop()
+            self.update_scores(last_move, -1)
+            self.move_piece_squares(last_move, False)
+            piece_captured = piece_codes[state >> 11 & 15]
+
+            self.board[last_move.end_row][last_move.end_col] = piece_captured            # replacing the captured piece 
             self.board[last_move.start_row][last_move.start_col] = last_move.piece_moved # placing the moved piece at its original square
             self.white_to_move = not self.white_to_move # switching turns back
 
+            self.castling_rights = state & 15
+            self.enpassant_possible = square_locations[state >> 4 & 127]
+            self.halfmove_clock = state >> 15
+            if not self.white_to_move: # undoing a black move
+                self.fullmove_number -= 1
+
             if last_move.piece_moved[1] == "K": # a king move is to be undone
 
                 if last_move.piece_moved[0] == "w": # white king move is to be undone
-                    self.white_king_location = (last_move.start_row,last_move.start_col)
+                    self.white_king_location = square_locations[last_move.start_row*8 + last_move.start_col]
 
                 else:   # black king move is to be undone
-                    self.black_king_location = (last_move.start_row,last_move.start_col)
+                    self.black_king_location = square_locations[last_move.start_row*8 + last_move.start_col]
 
             # undoing an enpassant move
             if last_move.is_enpassant_move:
                 self.board[last_move.end_row][last_move.end_col] = "__"
-                self.board[last_move.start_row][last_move.end_col] = last_move.piece_captured
-                self.enpassant_possible = (last_move.end_row,last_move.end_col)
-            if last_move.piece_moved[1] == "P" and abs(last_move.start_row-last_move.end_row) == 2:
-                self.enpassant_possible = ()
-
-            # undoing castling rights
-            self.castling_rights_log.pop()
-            new_rights = self.castling_rights_log[-1] # getting rid of old castling rights and setting the current castling rights to what they were prior
-            self.current_castling_rights = castling_rights(new_rights.white_king_side, new_rights.black_king_side, new_rights.white_queen_side, new_rights.black_queen_side) 
+                self.board[last_move.start_row][last_move.end_col] = piece_captured
 
             # undoing a castle
             if last_move.is_castling_move:
@@ -125,95 +555,253 @@ class chess_engine():
                     self.board[last_move.end_row][last_move.end_col+1] = "__" # removing the rook that moved
         pass
 
-    def update_castling_rights(self,move):
+    def get_valid_moves(self): # moves that can be actually made without walking into a check, as Move objects
+        # positions seen before (after an undo, or going over the same line again) are answered from the move cache,
+        # which is keyed by the zobrist key make_move/undo_move keep up to date, so it never needs flushing
+        key = self.zobrist_log[-1]
+        entry = self.move_cache.get(key)
+        if entry is not None:
+            moves, self.checkmate, self.stalemate = entry
+            return list(moves)
+        board = self.board
+        moves = [Move.from_code(code,board) for code in self.get_valid_move_codes()]
+        self.move_cache.put(key, tuple(moves), self.checkmate, self.stalemate)
+        return moves
+        pass
+
+    def get_valid_move_codes(self, moves = None): # legal moves packed into ints (see encode_move), appended to an array
         
-        if move.piece_moved == "wK": # if white king is moved, white looses all castling rights
-            self.current_castling_rights.white_king_side = False
-            self.current_castling_rights.white_queen_side = False
+        # moves can be a preallocated array('H') that gets cleared and refilled, so search doesn't allocate one per node
+        if moves is None:
+            moves = array('H')
+        else:
+            del moves[:]
+
+        # instead of making every move and regenerating all of the opponent's replies, we find the
+        # pieces checking our king and the pieces pinned to it once, and restrict the moves directly
+        in_check, self.pins, checks = self.check_for_pins_and_checks()
+
+        if self.white_to_move:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
 
-        if move.piece_moved == "bK": # if black king is moved, black looses all castling rights
-            self.current_castling_rights.black_king_side = False
-            self.current_castling_rights.black_queen_side = False
+        # generating all of our possible moves (pinned pieces only move along their pin)
+        self.get_possible_move_codes(moves)
+        self.pins = {} # pins are only valid for the current position, get_possible_moves stays pseudo-legal
 
-        if move.piece_moved == "wR": # white rook moved, need to check which side white rook
+        if not in_check:
+            self.get_castling_moves(king_row,king_col,moves)
 
-            if move.start_row == 7: # making sure that if the pawn in front of the rook promotes, doesnt trigger the castling rights off
-                if move.start_col == 0: # queen side rook moved
-                    self.current_castling_rights.white_queen_side = False
-                if move.start_col == 7: # king side rook moved
-                    self.current_castling_rights.white_king_side = False
+        self.keep_legal_moves(moves, in_check, checks)
+
+        if len(moves)==0:
+            if in_check: # no more possible moves and player in check
+                self.checkmate = True
+            else:               # no more possible moves and player not in check
+                self.stalemate = True
+        else:                   # done to make sure undoing a move allows the game to come out of stale/checkmate
+            self.checkmate = False
+            self.stalemate = False
+        return moves
+        pass
 
-        if move.piece_moved == "bR": # black rook moved, need to check which one
+    def iter_valid_move_codes(self):
+        # yields the legal move codes one piece at a time, so a caller that stops early never generates the rest
+        # the position must be back to the same one whenever the next move is asked for (make_move/undo_move in between is fine)
 
-            if move.start_row == 0: # making sure that if the pawn in front of the rook promotes, doesnt trigger the castling rights off
-                if move.start_col == 0: # queen side rook moved
-                    self.current_castling_rights.black_queen_side = False
-                if move.start_col == 7: # king side rook moved
-                    self.current_castling_rights.black_king_side = False
+        in_check, pins, checks = self.check_for_pins_and_checks()
+        valid_squares = self.get_evasion_squares(checks)
+        if self.white_to_move:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
+        king_sq = king_row*8 + king_col
+
+        board = self.board
+        moves = array('H')
+        if len(checks) < 2: # in double check only the king can move
+            # a copy of the squares, the set changes while the caller plays the moves
+            for sq in list(self.piece_squares["w" if self.white_to_move else "b"]):
+                if sq == king_sq:
+                    continue
+                row = sq >> 3
+                col = sq & 7
+                del moves[:]
+                self.pins = pins # the pins are set again for every piece, the caller's searching in between replaces them
+                self.move_functions[board[row][col][1]](row,col,moves)
+                self.pins = {}
+                self.keep_legal_moves(moves, in_check, checks, valid_squares)
+                yield from moves
+
+        # king moves last, they are the only ones that need attack tests
+        del moves[:]
+        self.get_king_moves(king_row,king_col,moves)
+        if not in_check:
+            self.get_castling_moves(king_row,king_col,moves)
+        self.keep_legal_moves(moves, in_check, checks, valid_squares)
+        yield from moves
+
+    def iter_valid_moves(self): # same as iter_valid_move_codes, as Move objects
+        for code in self.iter_valid_move_codes():
+            yield Move.from_code(code, self.board)
+
+    def has_any_legal_move(self): # stops at the first legal move instead of generating them all
+        for code in self.iter_valid_move_codes():
+            return True
+        return False
 
-        if move.piece_captured == "wR":
+    def get_terminal_status(self): # "checkmate", "stalemate" or None, and sets the checkmate/stalemate flags to match
+        if self.has_any_legal_move():
+            self.checkmate = self.stalemate = False
+            return None
+        if self.in_check():
+            self.checkmate, self.stalemate = True, False
+            return "checkmate"
+        self.checkmate, self.stalemate = False, True
+        return "stalemate"
+
+    def get_valid_capture_codes(self, moves = None): # legal captures and promotions only, packed into ints (for quiescence search)
+        # unlike get_valid_move_codes this leaves checkmate/stalemate alone, having no captures says nothing about either
+        if moves is None:
+            moves = array('H')
+        else:
+            del moves[:]
 
-            if move.end_row == 7: # white rook captured
-                if move.end_col == 7: # king side rook captured
-                    self.current_castling_rights.white_king_side = False
+        in_check, self.pins, checks = self.check_for_pins_and_checks()
+        self.get_possible_capture_codes(moves)
+        self.pins = {}
+        self.keep_legal_moves(moves, in_check, checks)
+        return moves
 
-                if move.end_col == 0: # queen side rook captured
-                    self.current_castling_rights.white_queen_side = False
+    def get_evasion_squares(self, checks): # squares a non king move can end on to get out of a single check (capturing or blocking the checker)
 
-            if move.end_row == 0: # black rook captured
-                if move.end_col == 7: # king side rook captured
-                    self.current_castling_rights.black_king_side = False
-                
-                if move.end_col == 0: # queen side rook captured
-                    self.current_castling_rights.black_queen_side = False
+        if len(checks) != 1:
+            return ()
+        if self.white_to_move:
+            king_row, king_col = self.white_king_location
+        else:
+            king_row, king_col = self.black_king_location
+        check_row, check_col, dir_row, dir_col = checks[0]
+        if self.board[check_row][check_col][1] == "N": # a knight check can't be blocked
+            return (check_row*8+check_col,)
+        valid_squares = tuple((king_row+dir_row*i)*8 + king_col+dir_col*i for i in range(1,8))
+        return valid_squares[:valid_squares.index(check_row*8+check_col)+1]
+
+    def keep_legal_moves(self, moves, in_check, checks, valid_squares = None): # drops the moves of a pin-restricted move list that leave the king in check
+
+        if valid_squares is None:
+            valid_squares = self.get_evasion_squares(checks)
+
+        # keeping the legal moves by compacting them to the front of the array, which preserves their order
+        board = self.board
+        kept = 0
+        for code in moves:
+            start_sq = code & 63
+            if board[start_sq >> 3][start_sq & 7][1] == "K":
+                legal = code & move_flag_mask == castling_flag or self.king_move_is_safe(code)
+            elif code & move_flag_mask == enpassant_flag: # en passant removes two pawns from a rank, so it is tested directly
+                legal = self.enpassant_move_is_safe(code)
+            elif len(checks) > 1:                           # double check, only the king can move
+                legal = False
+            else:
+                legal = not in_check or (code >> 6) & 63 in valid_squares
+            if legal:
+                moves[kept] = code
+                kept += 1
+        del moves[kept:]
         pass
 
-    def get_valid_moves(self): # moves that can be actually made without walking into a check
-        
-        # debugging lines
-        """ for log in self.castling_rights_log:    
-            print(log.white_king_side, log.white_queen_side, log.black_king_side, log.black_queen_side, end=",")
-        print()
-        print("current castling rights : ")
-        print(self.current_castling_rights.white_king_side,self.current_castling_rights.white_queen_side,self.current_castling_rights.black_king_side,self.current_castling_rights.black_queen_side)
-         """
+    def check_for_pins_and_checks(self): # finds the enemy pieces checking our king and our pieces pinned to it
         
-        temp_enpassant_possible = self.enpassant_possible
-        temp_castling_rights = castling_rights(self.current_castling_rights.white_king_side,self.current_castling_rights.black_king_side
-                                              ,self.current_castling_rights.white_queen_side,self.current_castling_rights.black_queen_side)
-        # generating all of our possible moves regardless of legality
-
-        moves = self.get_possible_moves()
+        pins = {}   # (row, col) of a pinned piece -> direction from the king towards the pin
+        checks = [] # (row, col, direction row, direction col) of every piece giving check
+        in_check = False
 
         if self.white_to_move:
-            self.get_castling_moves(self.white_king_location[0],self.white_king_location[1],moves)
+            enemy_color, ally_color = "b", "w"
+            start_row, start_col = self.white_king_location
         else:
-            self.get_castling_moves(self.black_king_location[0],self.black_king_location[1],moves)
+            enemy_color, ally_color = "w", "b"
+            start_row, start_col = self.black_king_location
+
+        # only the enemy pieces on a line or a knight jump from the king can check it or pin something to it
+        board = self.board
+        king_sq = start_row*8 + start_col
+        lines = square_lines[king_sq]
+        pawn_directions = pawn_attack_directions[enemy_color]
+        for enemy_sq in self.piece_squares[enemy_color]:
+            d = lines[enemy_sq]
+            if d == -1:
+                continue
+            end_row = enemy_sq >> 3
+            end_col = enemy_sq & 7
+            piece_type = board[end_row][end_col][1]
+            if d == 8:
+                if piece_type == "N":
+                    in_check = True
+                    checks.append((end_row,end_col,end_row-start_row,end_col-start_col))
+                continue
+            if enemy_sq in adjacent_squares[king_sq]:
+                if piece_type in line_attackers[d] or piece_type == "K" or (piece_type == "P" and d in pawn_directions):
+                    in_check = True
+                    checks.append((end_row,end_col) + self.directions[d])
+                continue
+            if piece_type not in line_attackers[d]:
+                continue
+
+            # a slider : nothing in between is a check, exactly one of our pieces in between is a pin
+            possible_pin = ()
+            for r, c, end in ray_targets[king_sq][d]:
+                if end >> 6 == enemy_sq:
+                    if possible_pin == ():
+                        in_check = True
+                        checks.append((end_row,end_col) + self.directions[d])
+                    else:
+                        pins[possible_pin] = self.directions[d]
+                    break
+                square = board[r][c]
+                if square == "__":
+                    continue
+                if square[0] == ally_color and possible_pin == ():
+                    possible_pin = (r,c)
+                else: # a second piece in between, or an enemy piece shielding the king
+                    break
 
-        # make each move
+        return in_check, pins, checks
+        pass
 
-        for i in range(len(moves)-1,-1,-1):     # iterating through list of moves in reverse such that removal
-                                                # of elements(and the subsequent change in indices) does not 
-                                                # cause elements to get skipped
-            self.make_move(moves[i])            # going to each of our moves and making them
-                                                # making the move also shifts the turn to the opp, so flipping that
-            self.white_to_move = not self.white_to_move
-            if self.in_check():                 # if the current move we are evaluating puts us in check then it is discarded
-                moves.remove(moves[i])
-            self.white_to_move = not self.white_to_move # calling the in_check method also flips the white_to_move variable
-            self.undo_move()
+    def king_move_is_safe(self,code): # checks if the king is attacked on the square it moves to
+        
+        start_row, start_col = (code & 63) >> 3, code & 7
+        end_sq = (code >> 6) & 63
+        king = self.board[start_row][start_col]
+
+        # the king is lifted off its square so it doesn't shield itself from a slider behind it
+        self.board[start_row][start_col] = "__"
+        under_attack = self.square_under_attack(end_sq >> 3,end_sq & 7)
+        self.board[start_row][start_col] = king
+        return not under_attack
+        pass
 
-        if len(moves)==0:
-            if self.in_check(): # no more possible moves and player in check
-                self.checkmate = True
-            else:               # no more possible moves and player not in check
-                self.stalemate = True
-        else:                   # done to make sure undoing a move allows the game to come out of stale/checkmate
-            self.checkmate = False
-            self.stalemate = False
-        self.enpassant_possible = temp_enpassant_possible
-        self.current_castling_rights = temp_castling_rights
-        return moves
+    def enpassant_move_is_safe(self,code): # checks if an en passant capture leaves our king in check
+        
+        start_row, start_col = (code & 63) >> 3, code & 7
+        end_row, end_col = (code >> 9) & 7, (code >> 6) & 7
+        pawn = self.board[start_row][start_col]
+        captured = self.board[start_row][end_col]
+
+        # both pawns leave the same rank, which can uncover a rook or queen a pin check doesn't see
+        self.board[start_row][start_col] = "__"
+        self.board[start_row][end_col] = "__"
+        self.board[end_row][end_col] = pawn
+
+        in_check = self.in_check()
+
+        self.board[start_row][start_col] = pawn
+        self.board[start_row][end_col] = captured
+        self.board[end_row][end_col] = "__"
+        return not in_check
         pass
 
     def in_check(self): # evaluates if we are in check right now
@@ -225,449 +813,241 @@ class chess_engine():
         
         pass    
 
-    def square_under_attack(self,row,col):  # evaluates if the current square is under attack
-
-        self.white_to_move = not self.white_to_move
-        opp_moves = self.get_possible_moves()
-
-        for move in opp_moves:
-            if move.end_row == row and move.end_col == col:
-                self.white_to_move = not self.white_to_move
-                return True
-        self.white_to_move = not self.white_to_move
-        return False
+    def square_under_attack(self,row,col,attackers=None):  # evaluates if the current square is under attack by the opponent
+        
+        # goes over the opponent's pieces and only looks closer at the ones on a line or a knight jump from the square,
+        # instead of generating the opponent's moves. returns on the first attacker, unless a list is passed in as
+        # attackers, in which case the (row, col) of every attacking piece is appended to it
+        enemy_color = "b" if self.white_to_move else "w"
+        under_attack = False
+
+        board = self.board
+        sq = row*8 + col
+        lines = square_lines[sq]
+        pawn_directions = pawn_attack_directions[enemy_color]
+        for enemy_sq in self.piece_squares[enemy_color]:
+            d = lines[enemy_sq]
+            if d == -1:
+                continue
+            end_row = enemy_sq >> 3
+            end_col = enemy_sq & 7
+            piece_type = board[end_row][end_col][1] # "_" if the piece has been lifted off the board for a legality test
+            if d == 8:
+                attacking = piece_type == "N"
+            elif enemy_sq in adjacent_squares[sq]:
+                attacking = piece_type in line_attackers[d] or piece_type == "K" or (piece_type == "P" and d in pawn_directions)
+            elif piece_type in line_attackers[d]:
+                attacking = True
+                for r, c, end in ray_targets[sq][d]: # a slider, if nothing stands in between
+                    if end >> 6 == enemy_sq:
+                        break
+                    if board[r][c] != "__":
+                        attacking = False
+                        break
+            else:
+                attacking = False
+            if attacking:
+                if attackers is None:
+                    return True
+                attackers.append((end_row,end_col))
+                under_attack = True
+
+        return under_attack
         pass
 
     def get_possible_moves(self): # all possible moves that can be made regardless of if they end up in a check
-        moves = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board[row])):
-                turn = self.board[row][col][0]
-                if (turn == 'w' and self.white_to_move) or (turn == 'b' and not self.white_to_move):
-                    piece = self.board[row][col][1]
-
-                    self.move_functions[piece](row,col,moves) # calls appropriate move functions for each piece   
+        board = self.board
+        return [Move.from_code(code,board) for code in self.get_possible_move_codes()]
+        pass
+
+    def get_possible_move_codes(self, moves = None): # same as get_possible_moves, but packed into ints and appended to an array
+        if moves is None:
+            moves = array('H')
+        board = self.board
+        for sq in self.piece_squares["w" if self.white_to_move else "b"]: # only the squares our pieces are on
+            row = sq >> 3
+            col = sq & 7
+            self.move_functions[board[row][col][1]](row,col,moves) # calls appropriate move functions for each piece   
         return moves
         pass    
 
+    def get_possible_capture_codes(self, moves = None): # like get_possible_move_codes but only captures and promotions, quiet moves are never built
+        if moves is None:
+            moves = array('H')
+        board = self.board
+        own, enemy = ("w","b") if self.white_to_move else ("b","w")
+        forward = -1 if self.white_to_move else 1
+
+        for start_sq in self.piece_squares[own]:
+            row = start_sq >> 3
+            col = start_sq & 7
+            pin_direction = self.pins.get((row,col))
+            kind = board[row][col][1]
+
+            if kind == "P":
+                promoting = row == (1 if self.white_to_move else 6)
+                if promoting and board[row+forward][col] == "__" and pin_direction in (None,(-1,0),(1,0)):
+                    add_pawn_move(moves, start_sq | ((row+forward)*8+col) << 6, True)
+                for dir_col in (-1,1):
+                    c = col + dir_col
+                    if 0 <= c <= 7 and pin_direction in (None,(forward,dir_col),(-forward,-dir_col)):
+                        if board[row+forward][c][0] == enemy:
+                            add_pawn_move(moves, start_sq | ((row+forward)*8+c) << 6, promoting)
+                        elif (row+forward,c) == self.enpassant_possible:
+                            moves.append(start_sq | ((row+forward)*8+c) << 6 | enpassant_flag)
+
+            elif kind == "N" or kind == "K":
+                if pin_direction is not None: # a pinned knight can't move, the king is never pinned
+                    continue
+                for r, c, end in (knight_targets if kind == "N" else king_targets)[start_sq]:
+                    if board[r][c][0] == enemy:
+                        moves.append(start_sq | end)
+
+            else: # sliders, walking each ray up to the first piece
+                rays = ray_targets[start_sq]
+                for d in (rook_directions if kind == "R" else bishop_directions if kind == "B" else queen_directions):
+                    if pin_direction not in pin_allows[d]:
+                        continue
+                    for r, c, end in rays[d]:
+                        target = board[r][c]
+                        if target != "__":
+                            if target[0] == enemy:
+                                moves.append(start_sq | end)
+                            break
+        return moves
+
     def get_pawn_moves(self,row,col,moves): # gets all pawn moves for pawn at row, col and appends to list
         
+        start_sq = row*8 + col
+        pin_direction = self.pins.get((row,col)) # a pinned pawn can only move along the pin
+
+        # a pawn stepping onto the last row promotes, that move is added once for every promotion piece
+        promoting = row == (1 if self.white_to_move else 6)
+
         if self.white_to_move: # getting white pawn moves
             
             # one sq forward
-            if row != 0: # making sure pawn is not at last row
+            if row != 0 and pin_direction in (None,(-1,0),(1,0)): # making sure pawn is not at last row
                 if self.board[row-1][col] == "__": # the square in front is empty
-                    moves.append(Move((row,col),(row-1,col),self.board))
+                    add_pawn_move(moves, start_sq | ((row-1)*8+col) << 6, promoting)
             
             # two sq forward
-            if row == 6: # making sure pawn is at starting positon
+            if row == 6 and pin_direction in (None,(-1,0),(1,0)): # making sure pawn is at starting positon
                 if self.board[row-1][col] == "__" and self.board[row-2][col] == "__": # checking both squares in front
-                    moves.append(Move((row,col),(row-2,col),self.board))
+                    moves.append(start_sq | ((row-2)*8+col) << 6)
 
             # 1 sq diagnal right
-            if col != 7: # checking if pawn is at right edge
+            if col != 7 and pin_direction in (None,(-1,1),(1,-1)): # checking if pawn is at right edge
                 if self.board[row-1][col+1][0] == "b": # making sure diag sq has a black piece
-                    moves.append(Move((row,col),(row-1,col+1),self.board))
+                    add_pawn_move(moves, start_sq | ((row-1)*8+col+1) << 6, promoting)
                 elif (row-1,col+1) == self.enpassant_possible:
-                    moves.append(Move((row,col),(row-1,col+1),self.board,is_enpassant_move=True))
+                    moves.append(start_sq | ((row-1)*8+col+1) << 6 | enpassant_flag)
 
             # 1 sq diag left
-            if col != 0: # checking if pawn is at left edge
+            if col != 0 and pin_direction in (None,(-1,-1),(1,1)): # checking if pawn is at left edge
                 if self.board[row-1][col-1][0] == "b": # making sure diag sq has a black piece
-                    moves.append(Move((row,col),(row-1,col-1),self.board))
+                    add_pawn_move(moves, start_sq | ((row-1)*8+col-1) << 6, promoting)
                 elif (row-1,col-1) == self.enpassant_possible:
-                    moves.append(Move((row,col),(row-1,col-1),self.board,is_enpassant_move=True))
+                    moves.append(start_sq | ((row-1)*8+col-1) << 6 | enpassant_flag)
         
         else: # getting black pawn moves
             
             # one sq forward
-            if row != 7: # checking if pawn is at last row
+            if row != 7 and pin_direction in (None,(-1,0),(1,0)): # checking if pawn is at last row
                 if self.board[row+1][col] == "__": # the square in front is empty
-                    moves.append(Move((row,col),(row+1,col),self.board))
+                    add_pawn_move(moves, start_sq | ((row+1)*8+col) << 6, promoting)
         
             # two sq forward
-            if row == 1:
+            if row == 1 and pin_direction in (None,(-1,0),(1,0)):
                 if self.board[row+1][col] == "__" and self.board[row+2][col] == "__": # checking both squares in front and if pawn at starting pos
-                    moves.append(Move((row,col),(row+2,col),self.board))
+                    moves.append(start_sq | ((row+2)*8+col) << 6)
 
             # 1 sq diagnal right
-            if col != 7: # checking if pawn is at right edge
+            if col != 7 and pin_direction in (None,(1,1),(-1,-1)): # checking if pawn is at right edge
                 if self.board[row+1][col+1][0] == "w": # making sure diag sq has a white piece
-                    moves.append(Move((row,col),(row+1,col+1),self.board))
+                    add_pawn_move(moves, start_sq | ((row+1)*8+col+1) << 6, promoting)
                 elif (row+1,col+1) == self.enpassant_possible:
-                    moves.append(Move((row,col),(row+1,col+1),self.board,is_enpassant_move=True))
+                    moves.append(start_sq | ((row+1)*8+col+1) << 6 | enpassant_flag)
 
             # 1 sq diag left
-            if col != 0: # checking if pawn is at left edge
+            if col != 0 and pin_direction in (None,(1,-1),(-1,1)): # checking if pawn is at left edge
                 if self.board[row+1][col-1][0] == "w": # making sure diag sq has a white piece
-                    moves.append(Move((row,col),(row+1,col-1),self.board))
+                    add_pawn_move(moves, start_sq | ((row+1)*8+col-1) << 6, promoting)
                 elif (row+1,col-1) == self.enpassant_possible:
-                    moves.append(Move((row,col),(row+1,col-1),self.board,is_enpassant_move=True))
+                    moves.append(start_sq | ((row+1)*8+col-1) << 6 | enpassant_flag)
         pass
 
     def get_rook_moves(self,row,col,moves): # gets all rook moves for rook at row, col and appends to list
-        
-        # getting all moves moving north
-        if row != 0: # making sure we arent at northmost rank
-            for r in range(row-1,-1,-1): # going north one square at a time
-            
-                if self.board[r][col] == "__":  # square is unoccupied
-                    moves.append(Move((row,col),(r,col),self.board))
-
-                elif self.white_to_move and self.board[r][col][0] == "w": # white's turn and white piece in the way
-                    break
-
-                elif self.white_to_move and self.board[r][col][0] == "b": # white's turn and black piece in the way
-                    moves.append(Move((row,col),(r,col),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[r][col][0] == "w": # black's turn and white piece in the way
-                    moves.append(Move((row,col),(r,col),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[r][col][0] == "b": # black's turn and black piece in the way
-                    break
-        
-        # getting all moves going south
-        if row != 7: # checking that we arent that southmost rank
-            for r in range(row+1,8,1):
-                
-                if self.board[r][col] == "__":  # square is unoccupied
-                    moves.append(Move((row,col),(r,col),self.board))
-
-                elif self.white_to_move and self.board[r][col][0] == "w": # white's turn and white piece in the way
-                    break
-
-                elif self.white_to_move and self.board[r][col][0] == "b": # white's turn and black piece in the way
-                    moves.append(Move((row,col),(r,col),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[r][col][0] == "w": # black's turn and white piece in the way
-                    moves.append(Move((row,col),(r,col),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[r][col][0] == "b": # black's turn and black piece in the way
-                    break
-        
-        # getting all moves going east
-        if col!= 7: # checking that we arent at eastmost file
-            for c in range(col+1,8,1):
-
-                if self.board[row][c] == "__":  # square is unoccupied
-                    moves.append(Move((row,col),(row,c),self.board))
-
-                elif self.white_to_move and self.board[row][c][0] == "w": # white's turn and white piece in the way
-                    break
-
-                elif self.white_to_move and self.board[row][c][0] == "b": # white's turn and black piece in the way
-                    moves.append(Move((row,col),(row,c),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[row][c][0] == "w": # black's turn and white piece in the way
-                    moves.append(Move((row,col),(row,c),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[row][c][0] == "b": # black's turn and black piece in the way
-                    break
-        
-        # getting all moves going west
-        if col!=0: # checking we arent at westmost file
-            for c in range(col-1,-1,-1):
-
-                if self.board[row][c] == "__":  # square is unoccupied
-                    moves.append(Move((row,col),(row,c),self.board))
-
-                elif self.white_to_move and self.board[row][c][0] == "w": # white's turn and white piece in the way
-                    break
-
-                elif self.white_to_move and self.board[row][c][0] == "b": # white's turn and black piece in the way
-                    moves.append(Move((row,col),(row,c),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[row][c][0] == "w": # black's turn and white piece in the way
-                    moves.append(Move((row,col),(row,c),self.board))
-                    break
-
-                elif not self.white_to_move and self.board[row][c][0] == "b": # black's turn and black piece in the way
-                    break
-        
+        self.get_slider_moves(row,col,moves,rook_directions)
         pass
 
     def get_bishop_moves(self,row,col,moves): # gets all bishop moves for bishop at row, col and appends to list
-        
-        # getting moves going northeast
-        r = row-1
-        c = col+1
-        while(r >= 0 and c <= 7):
-            
-            if self.board[r][c] == "__":  # square is unoccupied
-                moves.append(Move((row,col),(r,c),self.board))
-
-            elif self.white_to_move and self.board[r][c][0] == "w": # white's turn and white piece in the way
-                break
-
-            elif self.white_to_move and self.board[r][c][0] == "b": # white's turn and black piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "w": # black's turn and white piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "b": # black's turn and black piece in the way
-                break
-            
-            r -= 1
-            c += 1
-        
-        # getting moves going southeast
-        r = row+1
-        c = col+1
-        while(r <= 7 and c <= 7):
-            
-            if self.board[r][c] == "__":  # square is unoccupied
-                moves.append(Move((row,col),(r,c),self.board))
-
-            elif self.white_to_move and self.board[r][c][0] == "w": # white's turn and white piece in the way
-                break
-
-            elif self.white_to_move and self.board[r][c][0] == "b": # white's turn and black piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "w": # black's turn and white piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "b": # black's turn and black piece in the way
-                break
-            
-            r += 1
-            c += 1
-        
-        # getting moves going southwest
-        r = row+1
-        c = col-1
-        while(r <= 7 and c >= 0):
-            
-            if self.board[r][c] == "__":  # square is unoccupied
-                moves.append(Move((row,col),(r,c),self.board))
-
-            elif self.white_to_move and self.board[r][c][0] == "w": # white's turn and white piece in the way
-                break
-
-            elif self.white_to_move and self.board[r][c][0] == "b": # white's turn and black piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "w": # black's turn and white piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "b": # black's turn and black piece in the way
-                break
-            
-            r += 1
-            c -= 1
-        
-        # getting moves going northwest
-        r = row-1
-        c = col-1
-        while(r >= 0 and c >= 0):
-            
-            if self.board[r][c] == "__":  # square is unoccupied
-                moves.append(Move((row,col),(r,c),self.board))
-
-            elif self.white_to_move and self.board[r][c][0] == "w": # white's turn and white piece in the way
-                break
-
-            elif self.white_to_move and self.board[r][c][0] == "b": # white's turn and black piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "w": # black's turn and white piece in the way
-                moves.append(Move((row,col),(r,c),self.board))
-                break
-
-            elif not self.white_to_move and self.board[r][c][0] == "b": # black's turn and black piece in the way
-                break
-            
-            r -= 1
-            c -= 1
-        
+        self.get_slider_moves(row,col,moves,bishop_directions)
         pass
 
-    def get_knight_moves(self,row,col,moves): # gets all knight moves for knight at row, col and appends to list
-        
-        if self.white_to_move: # knight is white
-
-            # moving 2 north and 1 east
-            if row >= 2 and col <= 6 and self.board[row-2][col+1][0]!="w":
-                moves.append(Move((row,col),(row-2,col+1),self.board))
-        
-            # moving 1 north and 2 east
-            if row >= 1 and col <= 5 and self.board[row-1][col+2][0]!="w":
-                moves.append(Move((row,col),(row-1,col+2),self.board))
-        
-            # moving 1 south and 2 east
-            if row <= 6 and col <= 5 and self.board[row+1][col+2][0]!="w":
-                moves.append(Move((row,col),(row+1,col+2),self.board))
-            
-            # moving 2 south and 1 east
-            if row <= 5 and col <= 6 and self.board[row+2][col+1][0]!="w":
-                moves.append(Move((row,col),(row+2,col+1),self.board))
-            
-            # moving 2 south and 1 west
-            if row <= 5 and col >= 1 and self.board[row+2][col-1][0]!="w":
-                moves.append(Move((row,col),(row+2,col-1),self.board))
-            
-            # moving 1 south and 2 west
-            if row <= 6 and col >= 2 and self.board[row+1][col-2][0]!="w":
-                moves.append(Move((row,col),(row+1,col-2),self.board))
-
-            # moving 1 north and 2 west
-            if row >= 1 and col >= 2 and self.board[row-1][col-2][0]!="w":
-                moves.append(Move((row,col),(row-1,col-2),self.board))
-            
-            # moving 2 north and 1 west
-            if row >= 2 and col >= 1 and self.board[row-2][col-1][0]!="w":
-                moves.append(Move((row,col),(row-2,col-1),self.board))
-        else: # knight is black
-
-            # moving 2 north and 1 east
-            if row >= 2 and col <= 6 and self.board[row-2][col+1][0]!="b":
-                moves.append(Move((row,col),(row-2,col+1),self.board))
-        
-            # moving 1 north and 2 east
-            if row >= 1 and col <= 5 and self.board[row-1][col+2][0]!="b":
-                moves.append(Move((row,col),(row-1,col+2),self.board))
-        
-            # moving 1 south and 2 east
-            if row <= 6 and col <= 5 and self.board[row+1][col+2][0]!="b":
-                moves.append(Move((row,col),(row+1,col+2),self.board))
-            
-            # moving 2 south and 1 east
-            if row <= 5 and col <= 6 and self.board[row+2][col+1][0]!="b":
-                moves.append(Move((row,col),(row+2,col+1),self.board))
-            
-            # moving 2 south and 1 west
-            if row <= 5 and col >= 1 and self.board[row+2][col-1][0]!="b":
-                moves.append(Move((row,col),(row+2,col-1),self.board))
-            
-            # moving 1 south and 2 west
-            if row <= 6 and col >= 2 and self.board[row+1][col-2][0]!="b":
-                moves.append(Move((row,col),(row+1,col-2),self.board))
+    def get_queen_moves(self,row,col,moves): # gets all queen moves for queen at row, col and appends to list
+        self.get_slider_moves(row,col,moves,queen_directions)
+        pass
 
-            # moving 1 north and 2 west
-            if row >= 1 and col >= 2 and self.board[row-1][col-2][0]!="b":
-                moves.append(Move((row,col),(row-1,col-2),self.board))
-            
-            # moving 2 north and 1 west
-            if row >= 2 and col >= 1 and self.board[row-2][col-1][0]!="b":
-                moves.append(Move((row,col),(row-2,col-1),self.board))
-        
+    def get_slider_moves(self,row,col,moves,slider_directions): # walks the precomputed rays of a slider up to the first piece
+
+        start_sq = row*8 + col
+        board = self.board
+        own = "w" if self.white_to_move else "b"
+        pin_direction = self.pins.get((row,col)) # a pinned slider can only move along the pin
+        rays = ray_targets[start_sq]
+
+        for d in slider_directions:
+            if pin_direction not in pin_allows[d]:
+                continue
+            for r, c, end in rays[d]:
+                target = board[r][c]
+                if target == "__":   # square is unoccupied
+                    moves.append(start_sq | end)
+                else:                # the first piece ends the ray, and can be taken if it's the opponent's
+                    if target[0] != own:
+                        moves.append(start_sq | end)
+                    break
         pass
 
-    def get_queen_moves(self,row,col,moves): # gets all queen moves for queen at row, col and appends to list
+    def get_knight_moves(self,row,col,moves): # gets all knight moves for knight at row, col and appends to list
         
-        self.get_rook_moves(row,col,moves)
-
-        self.get_bishop_moves(row,col,moves)
-
+        if (row,col) in self.pins: # a pinned knight can never move along its pin
+            return
+        start_sq = row*8 + col
+        board = self.board
+        own = "w" if self.white_to_move else "b"
+        for r, c, end in knight_targets[start_sq]:
+            if board[r][c][0] != own:
+                moves.append(start_sq | end)
         pass
 
     def get_king_moves(self,row,col,moves): # gets all king moves for king at row, col and appends to list
         
-        if self.white_to_move: # white king moves
-            
-            # moving north
-            if row != 0 and self.board[row-1][col][0]!="w":
-                moves.append(Move((row,col),(row-1,col),self.board))
-
-            # moving northeast
-            if row != 0 and col != 7 and self.board[row-1][col+1][0]!="w":
-                moves.append(Move((row,col),(row-1,col+1),self.board))
-
-            # moving east
-            if col != 7 and self.board[row][col+1][0]!="w":
-                moves.append(Move((row,col),(row,col+1),self.board))
-
-            # moving southeast
-            if row != 7 and col != 7 and self.board[row+1][col+1][0]!="w":
-                moves.append(Move((row,col),(row+1,col+1),self.board))
-
-            # moving south
-            if row != 7 and self.board[row+1][col][0]!="w":
-                moves.append(Move((row,col),(row+1,col),self.board))
-
-            # moving southwest
-            if row != 7 and col != 0 and self.board[row+1][col-1][0]!="w":
-                moves.append(Move((row,col),(row+1,col-1),self.board))
-
-            # moving west
-            if col != 0 and self.board[row][col-1][0]!="w":
-                moves.append(Move((row,col),(row,col-1),self.board))
-
-            # moving northwest
-            if row != 0 and col != 0 and self.board[row-1][col-1][0]!="w":
-                moves.append(Move((row,col),(row-1,col-1),self.board))    
-            pass
-        else: # black king moves
-            
-            # moving north
-            if row != 0 and self.board[row-1][col][0]!="b":
-                moves.append(Move((row,col),(row-1,col),self.board))
-
-            # moving northeast
-            if row != 0 and col != 7 and self.board[row-1][col+1][0]!="b":
-                moves.append(Move((row,col),(row-1,col+1),self.board))
-
-            # moving east
-            if col != 7 and self.board[row][col+1][0]!="b":
-                moves.append(Move((row,col),(row,col+1),self.board))
-
-            # moving southeast
-            if row != 7 and col != 7 and self.board[row+1][col+1][0]!="b":
-                moves.append(Move((row,col),(row+1,col+1),self.board))
-
-            # moving south
-            if row != 7 and self.board[row+1][col][0]!="b":
-                moves.append(Move((row,col),(row+1,col),self.board))
-
-            # moving southwest
-            if row != 7 and col != 0 and self.board[row+1][col-1][0]!="b":
-                moves.append(Move((row,col),(row+1,col-1),self.board))
-
-            # moving west
-            if col != 0 and self.board[row][col-1][0]!="b":
-                moves.append(Move((row,col),(row,col-1),self.board))
-
-            # moving northwest
-            if row != 0 and col != 0 and self.board[row-1][col-1][0]!="b":
-                moves.append(Move((row,col),(row-1,col-1),self.board))    
-            pass
-
+        start_sq = row*8 + col
+        board = self.board
+        own = "w" if self.white_to_move else "b"
+        for r, c, end in king_targets[start_sq]:
+            if board[r][c][0] != own:
+                moves.append(start_sq | end)
         pass
 
     def get_castling_moves(self,row,col,moves): # gets all castling moves and appends to list
         
-        # if king is under check, it cannot castle
-        if self.square_under_attack(row,col):
-            return
-
+        # only called when the king is not in check (a king under check cannot castle)
         if self.white_to_move:
         
-            if self.current_castling_rights.white_king_side:
+            if self.castling_rights & white_king_side:
                 self.get_king_side_castles(row,col,moves)
 
-            if self.current_castling_rights.white_queen_side:
+            if self.castling_rights & white_queen_side:
                 self.get_queen_side_castles(row,col,moves)
         else:
 
-            if self.current_castling_rights.black_king_side:
+            if self.castling_rights & black_king_side:
                 self.get_king_side_castles(row,col,moves)
 
-            if self.current_castling_rights.black_queen_side:
+            if self.castling_rights & black_queen_side:
                 self.get_queen_side_castles(row,col,moves)
         pass
 
@@ -677,36 +1057,72 @@ class chess_engine():
 
             if not self.square_under_attack(row,col+1) and not self.square_under_attack(row,col+2): # making sure neither square in the middle is under attack
 
-                moves.append(Move( (row,col), (row,col+2), self.board, is_castling_move = True))
+                moves.append(row*8+col | (row*8+col+2) << 6 | castling_flag)
         pass
 
     def get_queen_side_castles(self,row,col,moves):
         
         if self.board[row][col-1] == "__" and self.board[row][col-2] == "__" and self.board[row][col-3] == "__":
         
-            if not self.square_under_attack(row,col-1) and not self.square_under_attack(row,col-2) and not self.square_under_attack(row,col-3):   
+            # the king only crosses the two squares next to it, the third one just has to be empty
+            if not self.square_under_attack(row,col-1) and not self.square_under_attack(row,col-2):   
         
-                moves.append(Move( (row,col), (row,col-2), self.board, is_castling_move = True))
+                moves.append(row*8+col | (row*8+col-2) << 6 | castling_flag)
+        pass
+
+class move_cache(): # bounded least recently used cache of legal move lists and checkmate/stalemate, keyed by zobrist key
+
+    def __init__(self, size = 1024):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
         pass
 
-class castling_rights():
+    def get(self, key): # returns (moves, checkmate, stalemate) stored for key, or None
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, moves, checkmate, stalemate):
+        self.entries[key] = (moves, checkmate, stalemate)
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size: # dropping the least recently used position
+            self.entries.popitem(last = False)
+        pass
 
-    def __init__(self, wks, bks, wqs, bqs):
-        self.white_king_side = wks
-        self.black_king_side = bks
-        self.white_queen_side = wqs
-        self.black_queen_side = bqs
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
         pass
 
+    @property
+    def hit_rate(self):
+        return self.hits / (self.hits + self.misses) if self.hits + self.misses else 0.0
+
+    def get_stats(self):
+        return {"size":self.size, "entries":len(self.entries), "hits":self.hits, "misses":self.misses, "hit_rate":self.hit_rate}
+
 class Move():
 
+    # moves are shared between positions through Move.pool, so a move must never be changed once it is made
+    __slots__ = ("start_row","start_col","end_row","end_col","piece_moved","piece_captured","move_id",
+                 "is_pawn_promotion","promotion_piece","is_enpassant_move","is_castling_move")
+
     # mapping chess notation to its computer representation
     ranks_to_rows = {"1":7,"2":6,"3":5,"4":4,"5":3,"6":2,"7":1,"8":0}
     files_to_cols = {"a":0,"b":1,"c":2,"d":3,"e":4,"f":5,"g":6,"h":7}
     rows_to_ranks = {value:key for key, value in ranks_to_rows.items()}
     cols_to_files = {value:key for key, value in files_to_cols.items()}
 
-    def __init__(self, start_sq, end_sq, board, is_enpassant_move = False, is_castling_move = False): # enpassant possible is an optional parameter and does not need to be always passed
+    pool = {} # (code, piece moved, piece captured) -> Move, so the same move in the same setting is only built once
+
+    def __init__(self, start_sq, end_sq, board, is_enpassant_move = False, is_castling_move = False, promotion_piece = "Q"): # enpassant possible is an optional parameter and does not need to be always passed
         self.start_row = start_sq[0]
         self.start_col = start_sq[1]
         self.end_row = end_sq[0]
@@ -718,10 +1134,13 @@ class Move():
         self.move_id =  self.start_row*1000 + self.start_col*100 + self.end_row*10 + self.end_col
         #print(self.move_id)
 
-        # pawn promotion stuff
+        # pawn promotion stuff, the promotion piece ("N","B","R" or "Q") also goes into the move id (10000 and up)
         self.is_pawn_promotion = False
+        self.promotion_piece = ""
         if (self.piece_moved == "wP" and self.end_row == 0) or (self.piece_moved == "bP" and self.end_row == 7):
             self.is_pawn_promotion = True
+            self.promotion_piece = promotion_piece
+            self.move_id += 10000 * (promotion_pieces.index(promotion_piece) + 1)
 
         # enpassant stuff
         self.is_enpassant_move = is_enpassant_move
@@ -731,12 +1150,36 @@ class Move():
         # castling stuff
         self.is_castling_move = is_castling_move
 
+    @classmethod
+    def from_code(cls, code, board): # builds (or reuses) the Move for a packed move in the position on board
+        start_sq = code & 63
+        end_sq = (code >> 6) & 63
+        key = (code, board[start_sq >> 3][start_sq & 7], board[end_sq >> 3][end_sq & 7])
+        move = cls.pool.get(key)
+        if move is None:
+            move = cls((start_sq >> 3,start_sq & 7),(end_sq >> 3,end_sq & 7),board,
+                       is_enpassant_move = code & move_flag_mask == enpassant_flag, is_castling_move = code & move_flag_mask == castling_flag,
+                       promotion_piece = promotion_pieces[code >> 14])
+            cls.pool[key] = move
+        return move
+
+    @property
+    def code(self): # the move packed into an int (see encode_move)
+        code = self.start_row*8 + self.start_col | (self.end_row*8 + self.end_col) << 6
+        if self.is_enpassant_move:
+            code |= enpassant_flag
+        elif self.is_castling_move:
+            code |= castling_flag
+        elif self.is_pawn_promotion:
+            code |= promotion_flag | promotion_pieces.index(self.promotion_piece) << 14
+        return code
+
     def __eq__(self, value): # overriding the equals method(telling the comp how to compare two objects of class move)
         if isinstance(value,Move):
             return self.move_id == value.move_id
 
-    def get_chess_notation(self): # TO DO : convert to actual chess notation
-        return self.get_rank_file(self.start_row,self.start_col) + self.get_rank_file(self.end_row,self.end_col)
+    def get_chess_notation(self): # coordinate notation (eg e2e4, e7e8n), see chess_pgn.move_to_san for standard algebraic notation
+        return self.get_rank_file(self.start_row,self.start_col) + self.get_rank_file(self.end_row,self.end_col) + self.promotion_piece.lower()
 
     def get_rank_file(self,row,col): # returns the position in format : rankfile (eg a6)
         return self.cols_to_files[col] + self.rows_to_ranks[row]
\ No newline at end of file